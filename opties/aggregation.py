@@ -0,0 +1,445 @@
+# -*- coding: utf-8 -*-
+# Copyright 2023
+# Europa-Universität Flensburg,
+# Centre for Sustainable Energy Systems
+
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation; either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# File description
+"""
+This file contains the functions to aggregate the snapshots into typical
+periods before the optimization and to disaggregate the results afterwards.
+"""
+
+import numpy as np
+import pandas as pd
+
+from pyomo.environ import Constraint, Var, Reals, value
+from pyomo.repn import generate_standard_repn
+
+__copyright__ = (
+    "Europa-Universität Flensburg, Centre for Sustainable Energy Systems, "
+    "FossilExit Research Group"
+)
+__license__ = "GNU Affero General Public License Version 3 (AGPL-3.0)"
+__author__ = "KathiEsterl"
+
+
+class Clustering:
+    def __init__(self, snapshots, period_length, assignment, representatives):
+        # Cluster nach chronologischer Lage ihres typischen Zeitraums sortieren
+        order = np.argsort(representatives)
+        relabel = np.empty_like(order)
+        relabel[order] = np.arange(len(order))
+
+        self.snapshots = snapshots
+        self.period_length = period_length
+        self.assignment = relabel[assignment]
+        self.representatives = np.asarray(representatives)[order]
+        self.weights = np.bincount(self.assignment, minlength=len(order))
+
+        hours = np.arange(period_length)
+
+        self.reduced_snapshots = snapshots[
+            (self.representatives[:, None] * period_length + hours).ravel()
+        ]
+
+        # Position im reduzierten Network für jeden ursprünglichen Snapshot
+        self.mapping = (self.assignment[:, None] * period_length + hours).ravel()
+
+    @property
+    def n_periods(self):
+        return len(self.assignment)
+
+
+def clustering_features(network, snapshots, period_length):
+    # normierte Last-, Wärme-, Gas- und PV-Profile je Zeitraum
+    loads = network.loads_t.p_set.loc[snapshots]
+    carrier = network.loads.carrier.reindex(loads.columns)
+    carrier = carrier.where(carrier.isin(["AC", "heat"]), "gas")
+    profiles = loads.groupby(carrier, axis=1).sum()
+
+    pv = network.generators.index[network.generators.carrier == "PV"]
+    if len(pv) > 0:
+        profiles["PV"] = network.generators_t.p_max_pu.loc[snapshots, pv].mean(axis=1)
+
+    profiles = profiles / profiles.abs().max().replace(0, 1)
+
+    n_periods = len(snapshots) // period_length
+
+    return profiles.values.reshape(n_periods, period_length * profiles.shape[1])
+
+
+def kmeans_plus_plus(distances, k, rng):
+    # Startwerte: weit voneinander entfernte Zeiträume
+    centers = [rng.integers(len(distances))]
+
+    for _ in range(1, k):
+        d = distances[:, centers].min(axis=1)
+        if d.sum() == 0:
+            centers.append(rng.choice(np.setdiff1d(range(len(distances)), centers)))
+        else:
+            centers.append(rng.choice(len(distances), p=d / d.sum()))
+
+    return np.array(centers)
+
+
+def kmedoids(features, k, max_iter=100, seed=0):
+    distances = ((features[:, None, :] - features[None, :, :]) ** 2).sum(axis=2)
+    medoids = kmeans_plus_plus(distances, k, np.random.default_rng(seed))
+
+    for _ in range(max_iter):
+        assignment = distances[:, medoids].argmin(axis=1)
+
+        new = medoids.copy()
+        for c in range(k):
+            members = np.flatnonzero(assignment == c)
+            if len(members) > 0:
+                cost = distances[np.ix_(members, members)].sum(axis=1)
+                new[c] = members[cost.argmin()]
+
+        if (new == medoids).all():
+            break
+        medoids = new
+
+    return distances[:, medoids].argmin(axis=1), medoids
+
+
+def kmeans(features, k, max_iter=100, seed=0):
+    distances = ((features[:, None, :] - features[None, :, :]) ** 2).sum(axis=2)
+    centers = features[kmeans_plus_plus(distances, k, np.random.default_rng(seed))]
+
+    assignment = None
+    for _ in range(max_iter):
+        d = ((features[:, None, :] - centers[None, :, :]) ** 2).sum(axis=2)
+        new = d.argmin(axis=1)
+
+        if assignment is not None and (new == assignment).all():
+            break
+        assignment = new
+
+        for c in range(k):
+            members = assignment == c
+            if members.any():
+                centers[c] = features[members].mean(axis=0)
+            else:
+                # leeres Cluster mit dem am schlechtesten abgebildeten Zeitraum belegen
+                centers[c] = features[d.min(axis=1).argmax()]
+
+    # typischer Zeitraum: dem Schwerpunkt nächstgelegener Zeitraum des Clusters
+    d = ((features[:, None, :] - centers[None, :, :]) ** 2).sum(axis=2)
+    representatives = np.array(
+        [
+            np.flatnonzero(assignment == c)[d[assignment == c, c].argmin()]
+            for c in range(k)
+            if (assignment == c).any()
+        ]
+    )
+
+    return d[:, np.unique(assignment)].argmin(axis=1), representatives
+
+
+def cluster_snapshots(
+    network, snapshots, n_clusters, period_length=24, method="kmedoids", seed=0
+):
+    if len(snapshots) % period_length != 0:
+        raise ValueError(
+            "Anzahl der Snapshots ist kein Vielfaches der Periodenlänge "
+            + str(period_length)
+            + "."
+        )
+
+    features = clustering_features(network, snapshots, period_length)
+
+    if method == "kmedoids":
+        assignment, representatives = kmedoids(features, n_clusters, seed=seed)
+    elif method == "kmeans":
+        assignment, representatives = kmeans(features, n_clusters, seed=seed)
+    else:
+        raise ValueError("Unbekanntes Clusterverfahren: " + str(method))
+
+    return Clustering(snapshots, period_length, assignment, representatives)
+
+
+def aggregate_network(network, clustering):
+    reduced = network.copy(snapshots=clustering.reduced_snapshots)
+
+    # Gewichtung der typischen Zeiträume mit der Anzahl ihrer Clustermitglieder,
+    # die Speicherbilanzen bleiben stündlich
+    weights = np.repeat(clustering.weights, clustering.period_length)
+    reduced.snapshot_weightings = network.snapshot_weightings.loc[
+        clustering.reduced_snapshots
+    ].copy()
+    reduced.snapshot_weightings["objective"] *= weights
+    reduced.snapshot_weightings["generators"] *= weights
+
+    # Speicherstände im reduzierten Network sind relativ zum Beginn des
+    # jeweiligen Zeitraums (intra-period), Anfangswerte und Zyklizität werden
+    # über die Speicherstände zwischen den Zeiträumen abgebildet
+    clustering.initial = {
+        "Store": network.stores[["e_cyclic", "e_initial"]].copy(),
+        "StorageUnit": network.storage_units[
+            ["cyclic_state_of_charge", "state_of_charge_initial"]
+        ].copy(),
+    }
+
+    reduced.stores["e_cyclic"] = False
+    reduced.stores["e_initial"] = 0.0
+    reduced.storage_units["cyclic_state_of_charge"] = False
+    reduced.storage_units["state_of_charge_initial"] = 0.0
+
+    return reduced
+
+
+def downsample_network(network, snapshots, resolution):
+    # jeweils resolution aufeinanderfolgende Snapshots zusammenfassen,
+    # Zeitreihen werden gemittelt und Gewichtungen summiert
+    groups = np.arange(len(snapshots)) // resolution
+    reduced_snapshots = snapshots[::resolution]
+
+    reduced = network.copy(snapshots=reduced_snapshots)
+
+    reduced.snapshot_weightings = (
+        network.snapshot_weightings.loc[snapshots]
+        .groupby(groups)
+        .sum()
+        .set_axis(reduced_snapshots)
+    )
+
+    for c in network.iterate_components():
+        attrs = c.attrs[c.attrs.varying & c.attrs.status.str.startswith("Input")]
+
+        for attr in attrs.index:
+            df = c.pnl[attr]
+            if df.empty:
+                continue
+
+            reduced.pnl(c.name)[attr] = (
+                df.loc[snapshots].groupby(groups).mean().set_axis(reduced_snapshots)
+            )
+
+    return reduced
+
+
+def drop_variable(constraint, var):
+    repn = generate_standard_repn(constraint.body)
+
+    body = repn.constant + sum(
+        coef * v for coef, v in zip(repn.linear_coefs, repn.linear_vars) if v is not var
+    )
+
+    constraint.set_value(body == value(constraint.upper))
+
+
+def storage_settings(n, component):
+    model = n.model
+
+    if component == "Store":
+        df = n.stores
+        ext = df.index[df.e_nom_extendable]
+
+        def e_max(name):
+            if name in ext:
+                return model.store_e_nom[name] * df.at[name, "e_max_pu"]
+            return df.at[name, "e_nom"] * df.at[name, "e_max_pu"]
+
+        def e_min(name):
+            if name in ext:
+                return model.store_e_nom[name] * df.at[name, "e_min_pu"]
+            return df.at[name, "e_nom"] * df.at[name, "e_min_pu"]
+
+        return {
+            "df": df,
+            "e": model.store_e,
+            "balance": model.store_constraint,
+            "bounds": ["store_e_upper", "store_e_lower"],
+            "e_max": e_max,
+            "e_min": e_min,
+            "cyclic": "e_cyclic",
+            "initial": "e_initial",
+            "name": "store_e",
+        }
+
+    df = n.storage_units
+    ext = df.index[df.p_nom_extendable]
+
+    def e_max(name):
+        if name in ext:
+            return model.storage_p_nom[name] * df.at[name, "max_hours"]
+        return df.at[name, "p_nom"] * df.at[name, "max_hours"]
+
+    return {
+        "df": df,
+        "e": model.state_of_charge,
+        "balance": model.state_of_charge_constraint,
+        "bounds": ["state_of_charge_upper"],
+        "e_max": e_max,
+        "e_min": lambda name: 0,
+        "cyclic": "cyclic_state_of_charge",
+        "initial": "state_of_charge_initial",
+        "name": "state_of_charge",
+    }
+
+
+def inter_period_linkage_pyomo(n, sns, clustering, component):
+    # Verknüpfung der Speicherstände zwischen den Zeiträumen nach Kotzur et al.:
+    # Speicherstand = Stand zu Beginn des ursprünglichen Zeitraums (inter) +
+    # Stand innerhalb des typischen Zeitraums (intra)
+    model = n.model
+    s = storage_settings(n, component)
+    names = list(s["df"].index)
+
+    if len(names) == 0:
+        return
+
+    L = clustering.period_length
+    K = len(clustering.representatives)
+    periods = list(range(clustering.n_periods + 1))
+    cluster = {sn: i // L for i, sn in enumerate(sns)}
+    elapsed = n.snapshot_weightings.stores.loc[sns].values.reshape(K, L).sum(axis=1)
+
+    # Speicherbilanz am Beginn jedes typischen Zeitraums vom vorherigen trennen
+    for k in range(1, K):
+        for name in names:
+            drop_variable(s["balance"][name, sns[k * L]], s["e"][name, sns[k * L - 1]])
+
+    # intra-period Speicherstände dürfen negativ werden, Grenzen über inter
+    for index in s["e"]:
+        s["e"][index].domain = Reals
+        s["e"][index].setlb(None)
+        s["e"][index].setub(None)
+
+    for bound in s["bounds"]:
+        if hasattr(model, bound):
+            getattr(model, bound).deactivate()
+
+    inter = s["name"] + "_inter"
+    intra_max = s["name"] + "_intra_max"
+    intra_min = s["name"] + "_intra_min"
+
+    setattr(model, inter, Var(names, periods, domain=Reals))
+    setattr(model, intra_max, Var(names, range(K), bounds=(0, None)))
+    setattr(model, intra_min, Var(names, range(K), bounds=(None, 0)))
+
+    v_inter = getattr(model, inter)
+    v_max = getattr(model, intra_max)
+    v_min = getattr(model, intra_min)
+
+    def intra_upper(model, name, sn):
+        return s["e"][name, sn] <= v_max[name, cluster[sn]]
+
+    def intra_lower(model, name, sn):
+        return s["e"][name, sn] >= v_min[name, cluster[sn]]
+
+    def linkage(model, name, d):
+        k = clustering.assignment[d]
+        loss = (1 - s["df"].at[name, "standing_loss"]) ** elapsed[k]
+
+        return (
+            v_inter[name, d + 1]
+            == loss * v_inter[name, d] + s["e"][name, sns[(k + 1) * L - 1]]
+        )
+
+    def upper(model, name, d):
+        k = clustering.assignment[d]
+
+        return v_inter[name, d] + v_max[name, k] <= s["e_max"](name)
+
+    def lower(model, name, d):
+        k = clustering.assignment[d]
+        loss = (1 - s["df"].at[name, "standing_loss"]) ** elapsed[k]
+
+        return loss * v_inter[name, d] + v_min[name, k] >= s["e_min"](name)
+
+    def start(model, name):
+        # ursprüngliche Einstellungen aus dem nicht aggregierten Network
+        original = clustering.initial[component]
+        if original.at[name, s["cyclic"]]:
+            return v_inter[name, periods[-1]] == v_inter[name, 0]
+
+        return v_inter[name, 0] == original.at[name, s["initial"]]
+
+    setattr(
+        model, inter + "_intra_upper", Constraint(names, list(sns), rule=intra_upper)
+    )
+    setattr(
+        model, inter + "_intra_lower", Constraint(names, list(sns), rule=intra_lower)
+    )
+    setattr(model, inter + "_linkage", Constraint(names, periods[:-1], rule=linkage))
+    setattr(model, inter + "_upper", Constraint(names, periods[:-1], rule=upper))
+    setattr(model, inter + "_lower", Constraint(names, periods[:-1], rule=lower))
+    setattr(model, inter + "_start", Constraint(names, rule=start))
+
+
+def trocknungsanlage_aggregated_pyomo(n, clustering, target):
+    # Zielwert am Ende des ursprünglichen Zeitraums über den inter-period
+    # Speicherstand der Trocknungsanlage
+    def load_trocknungsanlage(model):
+        return model.store_e_inter["TA", clustering.n_periods] == target
+
+    n.model.load_trocknungsanlage = Constraint(rule=load_trocknungsanlage)
+
+
+def disaggregate_network(network, reduced, clustering):
+    snapshots = clustering.snapshots
+    positions = clustering.mapping
+
+    for c in reduced.iterate_components(
+        reduced.one_port_components | reduced.branch_components | {"Bus"}
+    ):
+        attrs = c.attrs[c.attrs.status.str.startswith("Output", na=False)]
+        df = network.df(c.name)
+
+        for attr in attrs.index[attrs.static]:
+            df.loc[c.df.index, attr] = c.df[attr]
+
+        pnl = network.pnl(c.name)
+        for attr in attrs.index[attrs.varying]:
+            if c.pnl[attr].empty:
+                continue
+
+            series = c.pnl[attr].iloc[positions].set_axis(snapshots)
+            pnl[attr] = series.reindex(network.snapshots, fill_value=0.0)
+
+    # Speicherstände aus inter- und intra-period Werten zusammensetzen
+    for component, attr, name in [
+        ("Store", "e", "store_e"),
+        ("StorageUnit", "state_of_charge", "state_of_charge"),
+    ]:
+        df = reduced.df(component)
+        if df.empty:
+            continue
+
+        inter_var = getattr(reduced.model, name + "_inter")
+        inter = pd.DataFrame(
+            {
+                i: [value(inter_var[i, d]) for d in range(clustering.n_periods)]
+                for i in df.index
+            }
+        )
+
+        L = clustering.period_length
+        elapsed = reduced.snapshot_weightings.stores.loc[
+            clustering.reduced_snapshots
+        ].values.reshape(-1, L)
+        elapsed = elapsed[clustering.assignment].cumsum(axis=1).ravel()
+
+        loss = (1 - df.standing_loss.values[None, :]) ** elapsed[:, None]
+        intra = reduced.pnl(component)[attr][df.index].iloc[positions].values
+        start = np.repeat(inter.values, L, axis=0)
+
+        soc = pd.DataFrame(loss * start + intra, index=snapshots, columns=df.index)
+        network.pnl(component)[attr] = soc.reindex(network.snapshots, fill_value=0.0)
+
+    network.objective = reduced.objective
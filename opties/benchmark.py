@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+# Copyright 2023
+# Europa-Universität Flensburg,
+# Centre for Sustainable Energy Systems
+
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation; either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# File description
+"""
+This file contains functions to benchmark and compare different
+implementations within the tool.
+"""
+
+import time
+import resource
+import multiprocessing
+import pandas as pd
+
+from concurrent.futures import ProcessPoolExecutor
+
+from data import import_data, import_timeseries, create_pypsa_network, build_network
+from optimization import kwk_efficiencies, plant_parameters, run_lopf, Constraints
+
+__copyright__ = (
+    "Europa-Universität Flensburg, Centre for Sustainable Energy Systems, "
+    "FossilExit Research Group"
+)
+__license__ = "GNU Affero General Public License Version 3 (AGPL-3.0)"
+__author__ = "KathiEsterl"
+
+
+def networks_equal(network_a, network_b):
+    # Vergleich aller statischen und zeitabhängigen Komponenten-Tabellen
+    if not network_a.snapshots.equals(network_b.snapshots):
+        return False
+
+    for c in network_a.iterate_components():
+        df_b = network_b.df(c.name)
+        if not c.df.sort_index(axis=1).equals(df_b.sort_index(axis=1)):
+            return False
+
+        pnl_b = network_b.pnl(c.name)
+        for attr, df in c.pnl.items():
+            if not df.sort_index(axis=1).equals(pnl_b[attr].sort_index(axis=1)):
+                return False
+
+    return True
+
+
+def compare_network_build(path="data/", use_real_data=False, repeat=3):
+    buses, lines, generators, storage_units, stores, links, loads = import_data(path)
+
+    el_loads, heat_load, gas_load, pv = import_timeseries(
+        path + "/timeseries/", use_real_data
+    )
+
+    times = pd.DataFrame(columns=["iterative", "bulk"], index=range(repeat))
+    networks = {}
+
+    for method in times.columns:
+        for i in range(repeat):
+            x = time.time()
+            networks[method] = create_pypsa_network(
+                buses,
+                lines,
+                generators,
+                storage_units,
+                stores,
+                links,
+                loads,
+                el_loads,
+                heat_load,
+                gas_load,
+                pv,
+                bulk=(method == "bulk"),
+            )
+            times.loc[i, method] = time.time() - x
+
+    if not networks_equal(networks["iterative"], networks["bulk"]):
+        raise Exception("Networks aus iterativem und Bulk-Aufbau unterscheiden sich.")
+
+    print("Time for network build [s]:")
+    print(times.astype(float).describe().loc[["mean", "min", "max"]].round(3))
+
+    return times
+
+
+# Optimierungs-Backends, jeweils Einstellungen in args["method"]
+BACKENDS = {
+    "pyomo": {"type": "lopf", "pyomo": True},
+    "nomopyomo": {"type": "lopf", "pyomo": False},
+    "linopy": {"type": "optimize"},
+}
+
+
+def run_backend(args, backend):
+    args = dict(args, method=dict(args["method"], **BACKENDS[backend]))
+
+    network = build_network(args)
+    kwk_efficiencies(network, plant_parameters(args)["c_v"])
+
+    constraints = Constraints(args)
+    times = {}
+
+    # extra_functionality wird nach dem Modellaufbau und vor dem Lösen aufgerufen
+    def extra_functionality(network, snapshots):
+        constraints.extra_functionalities(network, snapshots)
+        times["build"] = time.time() - x
+
+    x = time.time()
+    run_lopf(network, args, extra_functionality, export=False)
+    total = time.time() - x
+
+    # maximaler Speicherbedarf des Prozesses und externer Solver-Prozesse
+    memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    memory_solver = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+
+    return {
+        "build [s]": times["build"],
+        "solve [s]": total - times["build"],
+        "peak memory [MB]": memory,
+        "peak memory solver [MB]": memory_solver,
+        "objective": network.objective,
+    }
+
+
+def compare_backends(args, backends=BACKENDS):
+    # jedes Backend in einem eigenen Prozess, damit der Spitzenspeicher
+    # getrennt erfasst wird
+    results = {}
+
+    for backend in backends:
+        with ProcessPoolExecutor(
+            max_workers=1, mp_context=multiprocessing.get_context("spawn")
+        ) as executor:
+            results[backend] = executor.submit(run_backend, args, backend).result()
+
+    results = pd.DataFrame(results).T
+
+    print("Comparison of optimization backends:")
+    print(results.round(3))
+
+    return results
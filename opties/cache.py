@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+# Copyright 2023
+# Europa-Universität Flensburg,
+# Centre for Sustainable Energy Systems
+
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation; either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# File description
+"""
+This file contains the functions to cache parsed input data in a binary
+format next to the data folder.
+"""
+
+import os
+import json
+import pickle
+import hashlib
+import pandas as pd
+
+__copyright__ = (
+    "Europa-Universität Flensburg, Centre for Sustainable Energy Systems, "
+    "FossilExit Research Group"
+)
+__license__ = "GNU Affero General Public License Version 3 (AGPL-3.0)"
+__author__ = "KathiEsterl"
+
+
+CACHE_DIR = ".cache"
+
+# bei Änderungen an den Einlesefunktionen erhöhen, damit bestehende
+# Cache-Dateien neu erstellt werden
+CACHE_VERSION = 1
+
+
+def file_hash(file, chunk_size=2**20):
+    sha = hashlib.sha256()
+
+    with open(file, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            sha.update(chunk)
+
+    return sha.hexdigest()
+
+
+def file_signature(file):
+    stat = os.stat(file)
+
+    return {
+        "path": os.path.abspath(file),
+        "size": stat.st_size,
+        "mtime": stat.st_mtime_ns,
+    }
+
+
+def cache_paths(file, key=""):
+    # Cache-Dateien liegen im Unterordner .cache des jeweiligen Datenordners
+    folder, name = os.path.split(os.path.abspath(file))
+    cache_dir = os.path.join(folder, CACHE_DIR)
+
+    tag = hashlib.sha256((os.path.abspath(file) + key).encode()).hexdigest()[:12]
+    stem = os.path.join(cache_dir, os.path.splitext(name)[0] + "-" + tag)
+
+    return stem + ".pkl", stem + ".json"
+
+
+def is_valid(manifest, signature, file):
+    if manifest.get("version") != CACHE_VERSION:
+        return False
+
+    if manifest["path"] != signature["path"]:
+        return False
+
+    if manifest["size"] != signature["size"]:
+        return False
+
+    if manifest["mtime"] == signature["mtime"]:
+        return True
+
+    # Änderungszeitpunkt abweichend (z.B. nach Kopieren): Inhalt vergleichen
+    return manifest["sha256"] == file_hash(file)
+
+
+def read_cached(file, reader, key="", cache=True):
+    # reader: Funktion, die die Datei einliest und ein DataFrame zurückgibt
+    if not cache:
+        return reader(file)
+
+    data_fn, manifest_fn = cache_paths(file, key)
+    signature = file_signature(file)
+
+    if os.path.isfile(data_fn) and os.path.isfile(manifest_fn):
+        with open(manifest_fn) as f:
+            manifest = json.load(f)
+
+        if is_valid(manifest, signature, file):
+            if manifest["mtime"] != signature["mtime"]:
+                manifest["mtime"] = signature["mtime"]
+                with open(manifest_fn, "w") as f:
+                    json.dump(manifest, f)
+
+            return pd.read_pickle(data_fn)
+
+    df = reader(file)
+
+    os.makedirs(os.path.dirname(data_fn), exist_ok=True)
+
+    # über temporäre Dateien je Prozess schreiben, damit parallele Läufe keine
+    # unvollständigen Dateien lesen
+    tmp = "." + str(os.getpid()) + ".tmp"
+    df.to_pickle(data_fn + tmp)
+    os.replace(data_fn + tmp, data_fn)
+
+    manifest = dict(signature, sha256=file_hash(file), key=key, version=CACHE_VERSION)
+    with open(manifest_fn + tmp, "w") as f:
+        json.dump(manifest, f)
+    os.replace(manifest_fn + tmp, manifest_fn)
+
+    return df
+
+
+def clear_cache(path="data/"):
+    cache_dir = os.path.join(path, CACHE_DIR)
+
+    if os.path.isdir(cache_dir):
+        for fn in os.listdir(cache_dir):
+            os.remove(os.path.join(cache_dir, fn))
+
+
+def network_key(files, settings):
+    # Hash über die Inhalte der Eingangsdateien und die Einstellungen
+    sha = hashlib.sha256()
+
+    for fn in files:
+        sha.update(file_hash(fn).encode())
+
+    sha.update(json.dumps(settings, sort_keys=True, default=str).encode())
+
+    return sha.hexdigest()[:16]
+
+
+def network_cache_path(path, key):
+    return os.path.join(path, CACHE_DIR, "networks", key + ".pkl")
+
+
+def load_network(fn):
+    with open(fn, "rb") as f:
+        return pickle.load(f)
+
+
+def save_network(network, fn):
+    os.makedirs(os.path.dirname(fn), exist_ok=True)
+
+    # zunächst in temporäre Datei schreiben, damit abgebrochene oder parallele
+    # Läufe keine unvollständigen Networks im Cache hinterlassen
+    tmp = fn + "." + str(os.getpid()) + ".tmp"
+    with open(tmp, "wb") as f:
+        pickle.dump(network, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    os.replace(tmp, fn)
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+# Copyright 2023
+# Europa-Universität Flensburg,
+# Centre for Sustainable Energy Systems
+
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation; either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# File description
+"""
+This file contains the functions to save a checkpoint after each iteration of
+the line impedances and to resume an interrupted run from the last completed
+iteration, with the solver basis of that iteration as warm start.
+"""
+
+import os
+import json
+import pickle
+import shutil
+import hashlib
+
+from export import table_hash
+
+__copyright__ = (
+    "Europa-Universität Flensburg, Centre for Sustainable Energy Systems, "
+    "FossilExit Research Group"
+)
+__license__ = "GNU Affero General Public License Version 3 (AGPL-3.0)"
+__author__ = "KathiEsterl"
+
+
+CHECKPOINT = "checkpoint.pkl"
+BASIS = "checkpoint.bas"
+
+# Leitungsparameter, die zwischen den Iterationen angepasst werden
+LINE_ATTRS = ["x", "r", "g", "b", "num_parallel"]
+
+# Einstellungen ohne Einfluss auf die Lösung einer Iteration
+IGNORED = [
+    "csv_export",
+    "export",
+    "profiling",
+    "cache",
+    "network_cache",
+    "store",
+    "checkpoint",
+]
+
+
+def checkpoint_key(network, args):
+    # Hash über die Einstellungen und das Network vor der ersten Iteration,
+    # n_iter darf sich beim Fortsetzen ändern
+    settings = {key: value for key, value in args.items() if key not in IGNORED}
+    settings["method"] = {
+        key: value for key, value in args["method"].items() if key != "n_iter"
+    }
+
+    sha = hashlib.sha256()
+    sha.update(json.dumps(settings, sort_keys=True, default=str).encode())
+
+    for c in network.iterate_components():
+        sha.update(table_hash(c.df).encode())
+        for attr, df in c.pnl.items():
+            if not df.empty:
+                sha.update((attr + table_hash(df)).encode())
+
+    return sha.hexdigest()[:16]
+
+
+def solved_values(network):
+    # Ergebnisse (Output-Attribute) aller Komponenten
+    values = {}
+
+    for c in network.iterate_components():
+        attrs = c.attrs[c.attrs.status.str.startswith("Output")]
+
+        static = [attr for attr in attrs.index[attrs.static] if attr in c.df]
+        series = {
+            attr: c.pnl[attr].copy()
+            for attr in attrs.index[attrs.varying]
+            if attr in c.pnl and not c.pnl[attr].empty
+        }
+
+        values[c.name] = (c.df[static].copy(), series)
+
+    return values
+
+
+def restore_values(network, values):
+    for c, (static, series) in values.items():
+        df = network.df(c)
+        df[static.columns] = static.reindex(df.index)
+
+        pnl = network.pnl(c)
+        for attr, data in series.items():
+            pnl[attr] = data
+
+
+def warmstart_file(basis):
+    # Basis der vorherigen Iteration, falls vorhanden
+    if basis is not None and os.path.isfile(basis):
+        return basis
+
+    return None
+
+
+def keep_basis(fn, basis):
+    # neue Basis für die folgende Iteration bzw. die Fortsetzung übernehmen
+    if fn is not None and os.path.isfile(fn):
+        shutil.move(fn, basis)
+
+
+class Checkpoint:
+    def __init__(self, network, args):
+        path = args["csv_export"]
+        # die Basis wird bereits vor dem ersten Export abgelegt
+        os.makedirs(path, exist_ok=True)
+
+        self.fn = os.path.join(path, CHECKPOINT)
+        self.basis = os.path.join(path, BASIS)
+        self.key = checkpoint_key(network, args)
+
+    def discard(self):
+        for fn in [self.fn, self.basis]:
+            if os.path.isfile(fn):
+                os.remove(fn)
+
+    def load(self, network, lines):
+        # letzte abgeschlossene Iteration in das Network übernehmen, None ohne
+        # passenden Checkpoint
+        if not os.path.isfile(self.fn):
+            self.discard()
+            return None
+
+        with open(self.fn, "rb") as f:
+            state = pickle.load(f)
+
+        if state["key"] != self.key:
+            print("Checkpoint", self.fn, "does not match the args, starting anew")
+            self.discard()
+            return None
+
+        network.lines.loc[lines, LINE_ATTRS] = state["lines"]
+        restore_values(network, state["values"])
+        network.objective = state["objective"]
+
+        print(
+            "Resuming after LOPF iteration",
+            state["iteration"],
+            "from checkpoint",
+            self.fn,
+        )
+
+        return state
+
+    def save(self, network, lines, iteration, s_nom_pre, history, converged):
+        # Leitungsparameter und s_nom_pre der Iteration (vor der Anpassung),
+        # Lösung und Verlauf der Konvergenz
+        state = {
+            "key": self.key,
+            "iteration": iteration,
+            "lines": network.lines.loc[lines, LINE_ATTRS].copy(),
+            "s_nom_pre": s_nom_pre.copy(),
+            "objective": network.objective,
+            "values": solved_values(network),
+            "history": list(history),
+            "converged": converged,
+        }
+
+        # zunächst in temporäre Datei schreiben, damit ein Abbruch während des
+        # Schreibens den letzten Checkpoint nicht zerstört
+        tmp = self.fn + "." + str(os.getpid()) + ".tmp"
+        with open(tmp, "wb") as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+        os.replace(tmp, self.fn)
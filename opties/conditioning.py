@@ -0,0 +1,423 @@
+# -*- coding: utf-8 -*-
+# Copyright 2023
+# Europa-Universität Flensburg,
+# Centre for Sustainable Energy Systems
+
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation; either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# File description
+"""
+This file contains the functions to report the coefficient ranges of the
+model per constraint family and to scale the linopy model before the solve,
+with the solution scaled back afterwards.
+"""
+
+import os
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from pyomo.environ import Constraint, Var, value
+from pyomo.repn import generate_standard_repn
+
+from profiling import phase
+
+__copyright__ = (
+    "Europa-Universität Flensburg, Centre for Sustainable Energy Systems, "
+    "FossilExit Research Group"
+)
+__license__ = "GNU Affero General Public License Version 3 (AGPL-3.0)"
+__author__ = "KathiEsterl"
+
+
+# Familien der Nebenbedingungen nach Teilen ihrer Namen (pyomo und linopy),
+# die erste passende Familie gilt
+FAMILIES = [
+    ("KWK", ["kwk"]),
+    ("Trocknungsanlage", ["trocknungsanlage"]),
+    ("Ausbau", ["_nom", "global"]),
+    ("Speicher", ["state_of_charge", "storage", "store", "inter_period"]),
+    ("Leitungen", ["cycle", "kirchhoff", "flow", "line", "transformer"]),
+    ("Knotenbilanz", ["power_balance", "nodal_balance"]),
+    ("Erzeugung und Links", ["generator", "link", "ramp", "committable"]),
+]
+
+# Iterationen der Skalierung (Gauß-Seidel für die Kleinste-Quadrate-Lösung)
+ITERATIONS = 20
+
+
+def constraint_family(name):
+    lower = name.lower()
+
+    for family, parts in FAMILIES:
+        if any(part in lower for part in parts):
+            return family
+
+    return "Sonstige"
+
+
+def pyomo_coefficients(model):
+    # je Nebenbedingung: Koeffizienten der Matrix und rechte Seiten
+    for con in model.component_objects(Constraint, active=True):
+        a = []
+        b = []
+
+        for data in con.values():
+            if not data.active:
+                continue
+
+            # feste Variablen sind in der Konstanten enthalten
+            repn = generate_standard_repn(data.body, quadratic=False)
+            a.extend(value(coef) for coef in repn.linear_coefs)
+
+            for bound in [data.lower, data.upper]:
+                if bound is not None:
+                    b.append(value(bound) - value(repn.constant))
+
+        yield con.local_name, np.array(a, dtype=float), np.array(b, dtype=float)
+
+
+def pyomo_objective(model):
+    repn = generate_standard_repn(model.objective.expr, quadratic=False)
+    return np.array([value(coef) for coef in repn.linear_coefs], dtype=float)
+
+
+def pyomo_bounds(model):
+    bounds = [
+        bound
+        for var in model.component_data_objects(Var)
+        if not var.fixed
+        for bound in [var.lb, var.ub]
+        if bound is not None
+    ]
+    return np.array(bounds, dtype=float)
+
+
+def linopy_coefficients(model):
+    constraints = model.constraints
+
+    for name in constraints.labels:
+        labels = constraints.labels[name]
+        terms = (constraints.vars[name] != -1) & (labels != -1)
+
+        yield (
+            name,
+            constraints.coeffs[name].where(terms).values.ravel(),
+            constraints.rhs[name].where(labels != -1).values.ravel(),
+        )
+
+
+def linopy_objective(model):
+    objective = model.objective
+    return objective.coeffs.where(objective.vars != -1).values.ravel()
+
+
+def linopy_bounds(model):
+    variables = model.variables
+
+    return np.concatenate(
+        [
+            getattr(variables, bound)[name]
+            .where(variables.labels[name] != -1)
+            .values.ravel()
+            for name in variables.labels
+            for bound in ["lower", "upper"]
+        ]
+    )
+
+
+def magnitudes(values):
+    values = np.abs(values[np.isfinite(values)])
+    return values[values > 0]
+
+
+def value_range(values):
+    values = magnitudes(values)
+
+    if not values.size:
+        return np.nan, np.nan
+
+    return values.min(), values.max()
+
+
+def coefficient_ranges(coefficients, objective, bounds):
+    # Wertebereiche der Matrix (a) und der rechten Seiten (b) je Familie
+    families = {}
+    for name, a, b in coefficients:
+        family = families.setdefault(constraint_family(name), ([], []))
+        family[0].append(a)
+        family[1].append(b)
+
+    families["Zielfunktion"] = ([objective], [])
+    families["Variablengrenzen"] = ([], [bounds])
+
+    rows = {}
+    for family, (a, b) in families.items():
+        a_min, a_max = value_range(np.concatenate(a) if a else np.array([]))
+        b_min, b_max = value_range(np.concatenate(b) if b else np.array([]))
+
+        rows[family] = {
+            "nonzeros": sum(magnitudes(x).size for x in a),
+            "min |a|": a_min,
+            "max |a|": a_max,
+            "range a": a_max / a_min,
+            "min |b|": b_min,
+            "max |b|": b_max,
+            "range b": b_max / b_min,
+        }
+
+    # Familien ohne Einträge (z.B. ohne globale Nebenbedingungen) entfallen
+    table = pd.DataFrame(rows).T.dropna(how="all", subset=["min |a|", "min |b|"])
+    table.index.name = "family"
+
+    return table
+
+
+def model_ranges(network, backend):
+    model = network.model
+
+    if backend == "pyomo":
+        return coefficient_ranges(
+            pyomo_coefficients(model), pyomo_objective(model), pyomo_bounds(model)
+        )
+
+    return coefficient_ranges(
+        linopy_coefficients(model), linopy_objective(model), linopy_bounds(model)
+    )
+
+
+def label_count(labels):
+    # Anzahl der vergebenen Labels (größtes Label + 1) über alle Arrays
+    return max([int(da.max()) for da in labels.values()], default=-1) + 1
+
+
+def label_groups(labels, n_labels):
+    # Gruppe je Array und Komponente (alle Dimensionen außer snapshot), die
+    # Snapshots einer Komponente werden gleich skaliert
+    groups = np.full(n_labels + 1, -1)
+    n_groups = 0
+
+    for name, da in labels.items():
+        other = [dim for dim in da.dims if dim != "snapshot"]
+        da = da.transpose(*[dim for dim in da.dims if dim == "snapshot"], *other)
+
+        shape = [da.sizes[dim] for dim in other]
+        size = int(np.prod(shape))
+
+        ids = np.broadcast_to(n_groups + np.arange(size).reshape(shape), da.shape)
+        valid = da.values != -1
+        groups[da.values[valid]] = ids[valid]
+
+        n_groups += size
+
+    return groups, n_groups
+
+
+def log_entries(labels, values):
+    # log2 der Beträge ungleich 0 mit den zugehörigen Labels
+    labels, values = xr.broadcast(labels, values)
+    values = values.transpose(*labels.dims).values.ravel()
+    labels = labels.values.ravel()
+
+    valid = (labels != -1) & np.isfinite(values) & (values != 0)
+
+    return labels[valid], np.log2(np.abs(values[valid]))
+
+
+def group_mean(groups, weights, n_groups):
+    total = np.zeros(n_groups)
+    count = np.zeros(n_groups)
+
+    for g, w in zip(groups, weights):
+        total += np.bincount(g, weights=w, minlength=n_groups)
+        count += np.bincount(g, minlength=n_groups)
+
+    return total / np.maximum(count, 1)
+
+
+class Scaling:
+    def __init__(self, args):
+        method = args["method"]
+
+        self.mode = method.get("conditioning")
+        self.path = args["csv_export"]
+
+        if not self.mode:
+            self.backend = None
+        elif method.get("type", "lopf") == "optimize":
+            self.backend = "linopy"
+        elif method["pyomo"]:
+            self.backend = "pyomo"
+        else:
+            raise Exception("Konditionierung nur mit pyomo oder linopy möglich.")
+
+        if self.mode == "scale" and self.backend != "linopy":
+            raise Exception("Skalierung des Modells nur mit linopy möglich.")
+
+        self.factors = None
+
+    def scale(self, network, snapshots):
+        # nach extra_functionality und der Reduktion, vor dem Lösen aufrufen
+        self.factors = None
+
+        if self.backend is None:
+            return
+
+        with phase("conditioning"):
+            table = model_ranges(network, self.backend)
+            tables = {"original": table}
+
+            if self.mode == "scale":
+                self.factors = scaling_factors(network.model)
+                scale_linopy(network.model, *self.factors)
+                tables["scaled"] = model_ranges(network, self.backend)
+
+            table = pd.concat(tables, names=["model"])
+
+            os.makedirs(self.path, exist_ok=True)
+            table.to_csv(os.path.join(self.path, "conditioning.csv"))
+
+        print("Coefficient ranges of the model:")
+        print(table.to_string(float_format=lambda x: "%.3g" % x))
+
+    def unscale(self, network):
+        # vor der Übernahme der Lösung in das Network aufrufen
+        if self.factors is not None:
+            with phase("conditioning"):
+                unscale_linopy(network.model, *self.factors)
+
+
+def scaling_factors(model):
+    # Faktoren als Zweierpotenzen je Gruppe von Variablen (Spalten) und
+    # Nebenbedingungen (Zeilen) sowie für die Zielfunktion, so dass Matrix,
+    # rechte Seiten, Variablengrenzen und Zielfunktion möglichst nahe 1 liegen
+    # (Kleinste Quadrate der Logarithmen, Curtis-Reid)
+    variables = model.variables
+    constraints = model.constraints
+
+    n_vars = label_count(variables.labels)
+    n_cons = label_count(constraints.labels)
+
+    col_groups, n_cols = label_groups(variables.labels, n_vars)
+    row_groups, n_rows = label_groups(constraints.labels, n_cons)
+
+    # Matrix
+    a_rows, a_cols, a_log = [], [], []
+    for name in constraints.labels:
+        cols = constraints.vars[name]
+        rows = constraints.labels[name].broadcast_like(cols).transpose(*cols.dims)
+        coeffs = constraints.coeffs[name].transpose(*cols.dims).values
+        cols = cols.values
+        rows = rows.values
+
+        valid = (cols != -1) & (rows != -1) & np.isfinite(coeffs) & (coeffs != 0)
+
+        a_rows.append(rows[valid])
+        a_cols.append(cols[valid])
+        a_log.append(np.log2(np.abs(coeffs[valid])))
+
+    a_rows = row_groups[np.concatenate(a_rows)]
+    a_cols = col_groups[np.concatenate(a_cols)]
+    a_log = np.concatenate(a_log)
+
+    # rechte Seiten
+    b = [
+        log_entries(constraints.labels[name], constraints.rhs[name])
+        for name in constraints.labels
+    ]
+    b_rows = row_groups[np.concatenate([labels for labels, _ in b])]
+    b_log = np.concatenate([log for _, log in b])
+
+    # Variablengrenzen
+    u = [
+        log_entries(variables.labels[name], getattr(variables, bound)[name])
+        for name in variables.labels
+        for bound in ["lower", "upper"]
+    ]
+    u_cols = col_groups[np.concatenate([labels for labels, _ in u])]
+    u_log = np.concatenate([log for _, log in u])
+
+    # Zielfunktion
+    c_cols, c_log = log_entries(model.objective.vars, model.objective.coeffs)
+    c_cols = col_groups[c_cols]
+
+    R = np.zeros(n_rows)
+    S = np.zeros(n_cols)
+    O = 0.0
+
+    for _ in range(ITERATIONS):
+        R = -group_mean([a_rows, b_rows], [a_log + S[a_cols], b_log], n_rows)
+        S = -group_mean(
+            [a_cols, c_cols, u_cols],
+            [a_log + R[a_rows], c_log + O, -u_log],
+            n_cols,
+        )
+        O = -np.mean(c_log + S[c_cols]) if c_log.size else 0.0
+
+    # Zweierpotenzen: Skalierung und Rücktransformation ohne Rundungsfehler,
+    # Index -1 (fehlende Einträge) mit Faktor 1
+    col = np.ones(n_vars + 1)
+    valid = col_groups[:-1] != -1
+    col[:-1][valid] = 2.0 ** np.rint(S[col_groups[:-1][valid]])
+
+    row = np.ones(n_cons + 1)
+    valid = row_groups[:-1] != -1
+    row[:-1][valid] = 2.0 ** np.rint(R[row_groups[:-1][valid]])
+
+    return col, row, 2.0 ** np.rint(O)
+
+
+def factor(labels, factors):
+    return xr.DataArray(factors[labels.values], coords=labels.coords, dims=labels.dims)
+
+
+def scale_linopy(model, col, row, obj):
+    # Variable x = col * x', Nebenbedingung mal row, Zielfunktion mal obj
+    variables = model.variables
+    constraints = model.constraints
+
+    for name in constraints.labels:
+        labels = constraints.labels[name]
+        constraints.coeffs[name] = (
+            constraints.coeffs[name]
+            * factor(labels, row)
+            * factor(constraints.vars[name], col)
+        )
+        constraints.rhs[name] = constraints.rhs[name] * factor(labels, row)
+
+    for name in variables.labels:
+        scale = factor(variables.labels[name], col)
+        variables.lower[name] = variables.lower[name] / scale
+        variables.upper[name] = variables.upper[name] / scale
+
+    objective = model.objective
+    model.objective = type(objective)(
+        objective.assign(coeffs=objective.coeffs * factor(objective.vars, col) * obj)
+    )
+
+
+def unscale_linopy(model, col, row, obj):
+    for name in list(model.solution):
+        if name in model.variables.labels:
+            model.solution[name] = model.solution[name] * factor(
+                model.variables.labels[name], col
+            )
+
+    for name in list(model.dual):
+        if name in model.constraints.labels:
+            model.dual[name] = (
+                model.dual[name] * factor(model.constraints.labels[name], row) / obj
+            )
+
+    model.objective_value = model.objective_value / obj
@@ -22,12 +22,30 @@ This file contains the functions to import the corresponding data and build
 a PyPSA network container.
 """
 
+import os
+import time
 import pandas as pd
 import geopandas as gpd
 import shapely
 import pypsa
 
-from pypsa.linopt import get_var, linexpr, define_constraints
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from cache import (
+    read_cached,
+    network_key,
+    network_cache_path,
+    load_network,
+    save_network,
+)
+from timeseries import (
+    align_window,
+    infer_index,
+    locate,
+    open_timeseries,
+    read_window,
+)
+from profiling import phase
 
 __copyright__ = (
     "Europa-Universität Flensburg, Centre for Sustainable Energy Systems, "
@@ -37,66 +55,267 @@ __license__ = "GNU Affero General Public License Version 3 (AGPL-3.0)"
 __author__ = "KathiEsterl"
 
 
-def import_data(path="data/"):
-    buses = pd.read_csv(path + "buses.csv").set_index("name")
+def read_buses(file, crs=None):
+    buses = pd.read_csv(file).set_index("name")
     if "geometry" in buses.columns:
-        buses["geometry"] = buses["geometry"].apply(shapely.wkt.loads)
-        buses = gpd.GeoDataFrame(buses, geometry="geometry")
+        # WKT-Geometrien vektorisiert einlesen
+        buses["geometry"] = shapely.from_wkt(buses["geometry"].values)
 
-    lines = pd.read_csv(path + "lines.csv").set_index("id")
-    generators = pd.read_csv(path + "generators.csv").set_index("name")
-    storage_units = pd.read_csv(path + "storage_units.csv").set_index("name")
-    stores = pd.read_csv(path + "stores.csv").set_index("name")
-    links = pd.read_csv(path + "links.csv").set_index("name")
-    loads = pd.read_csv(path + "loads.csv").set_index("name")
+        if crs is None:
+            buses = gpd.GeoDataFrame(buses, geometry="geometry")
+        else:
+            # Koordinaten der Daten in WGS84, Projektion in das gewünschte crs
+            buses = gpd.GeoDataFrame(buses, geometry="geometry", crs="EPSG:4326")
+            buses = buses.to_crs(crs)
 
-    loads = loads.drop(["LS1", "LS2"])
+        buses["x"] = shapely.get_x(buses.geometry.values)
+        buses["y"] = shapely.get_y(buses.geometry.values)
 
-    return buses, lines, generators, storage_units, stores, links, loads
+    return buses
 
 
-def import_timeseries(path="data/timeseries/", use_real_data=False):
-    if use_real_data:
-        el_loads = pd.read_csv(path + "el_load_real.csv").set_index("time")
-        el_loads.index = pd.date_range("2023-02-15 00:00", "2023-11-07 10:00", freq="H")
+def read_table(file, index="name", cache=True):
+    return read_cached(
+        file,
+        lambda fn: pd.read_csv(fn).set_index(index),
+        key=index,
+        cache=cache,
+    )
 
-        heat_load = pd.read_csv(path + "heat_load_synth.csv").set_index("time")[
-            1080:7451
-        ]
-        heat_load.index = pd.date_range(
-            "2023-02-15 00:00", "2023-11-07 10:00", freq="H"
-        )
 
-        gas_load = pd.read_csv(path + "gas_load.csv").set_index("time")[1080:7451]
-        gas_load.index = pd.date_range("2023-02-15 00:00", "2023-11-07 10:00", freq="H")
+def run_tasks(tasks, parallel=True, load_times=None):
+    # tasks: {Dateiname: (Funktion, Argumente)}, Einlesen im Thread-Pool
+    if load_times is None:
+        load_times = {}
 
-        pv = pd.read_csv(path + "pv_timeseries.csv")[1080:7451]
-        pv = pd.Series(
-            pv["p_max_pu"].values,
-            index=pd.date_range("2023-02-15 00:00", "2023-11-07 10:00", freq="H"),
-        )
+    def timed(name, func, args):
+        x = time.time()
+        result = func(*args)
+        load_times[name] = time.time() - x
+
+        return result
 
+    if parallel:
+        with ThreadPoolExecutor() as pool:
+            futures = {
+                name: pool.submit(timed, name, func, args)
+                for name, (func, args) in tasks.items()
+            }
+            results = {name: future.result() for name, future in futures.items()}
     else:
-        el_loads = pd.read_csv(path + "el_load_synth.csv").set_index("time")
-        el_loads.index = pd.date_range("2019-01-01 00:00", "2019-12-31 23:00", freq="H")
+        results = {
+            name: timed(name, func, args) for name, (func, args) in tasks.items()
+        }
+
+    return results
+
+
+def data_tasks(path="data/", cache=True, crs=None):
+    # projizierte Koordinaten werden je crs im Cache abgelegt
+    return {
+        "buses.csv": (
+            read_cached,
+            (path + "buses.csv", partial(read_buses, crs=crs), str(crs or ""), cache),
+        ),
+        "lines.csv": (read_table, (path + "lines.csv", "id", cache)),
+        "generators.csv": (read_table, (path + "generators.csv", "name", cache)),
+        "storage_units.csv": (
+            read_table,
+            (path + "storage_units.csv", "name", cache),
+        ),
+        "stores.csv": (read_table, (path + "stores.csv", "name", cache)),
+        "links.csv": (read_table, (path + "links.csv", "name", cache)),
+        "loads.csv": (read_table, (path + "loads.csv", "name", cache)),
+    }
+
+
+def collect_data(results):
+    loads = results["loads.csv"].drop(["LS1", "LS2"])
+
+    return (
+        results["buses.csv"],
+        results["lines.csv"],
+        results["generators.csv"],
+        results["storage_units.csv"],
+        results["stores.csv"],
+        results["links.csv"],
+        loads,
+    )
+
+
+def import_data(path="data/", cache=True, parallel=True, load_times=None, crs=None):
+    results = run_tasks(data_tasks(path, cache, crs), parallel, load_times)
+
+    return collect_data(results)
+
+
+def read_rows(file, start, stop, index=None, cache=True):
+    # Zeilen start:stop der Datenzeilen (ohne Kopfzeile) einlesen, der Cache
+    # enthält die vollständige Datei und wird nur ohne Zeitfenster genutzt
+    if cache and start == 0 and stop is None:
+        df = read_cached(file, pd.read_csv, cache=cache)
+    else:
+        nrows = None if stop is None else stop - start
+        df = pd.read_csv(file, skiprows=range(1, start + 1), nrows=nrows)
 
-        heat_load = pd.read_csv(path + "heat_load_synth.csv").set_index("time")
-        heat_load.index = pd.date_range(
-            "2019-01-01 00:00", "2019-12-31 23:00", freq="H"
-        )
+    if index is not None:
+        df = df.set_index(index)
 
-        gas_load = pd.read_csv(path + "gas_load.csv").set_index("time")
-        gas_load.index = pd.date_range("2019-01-01 00:00", "2019-12-31 23:00", freq="H")
+    return df
 
-        pv = pd.read_csv(path + "pv_timeseries.csv")
-        pv = pd.Series(
-            pv["p_max_pu"].values,
-            index=pd.date_range("2019-01-01 00:00", "2019-12-31 23:00", freq="H"),
-        )
+
+def timeseries_settings(use_real_data=False):
+    # Standardindex, falls die Daten keinen Zeitindex enthalten
+    if use_real_data:
+        default = pd.date_range("2023-02-15 00:00", "2023-11-07 10:00", freq="H")
+        el_file = "el_load_real"
+        # Messzeitraum innerhalb der synthetischen Zeitreihen
+        offset = 1080
+    else:
+        default = pd.date_range("2019-01-01 00:00", "2019-12-31 23:00", freq="H")
+        el_file = "el_load_synth"
+        offset = 0
+
+    return default, el_file, offset
+
+
+def timeseries_window(path, el_file, snapshots=None):
+    # snapshots = (start_snapshot, end_snapshot) wie in args oder als
+    # Zeitpunkte: es werden nur die Zeilen dieses Zeitfensters eingelesen
+    if snapshots is None:
+        return 0, None
+
+    if isinstance(snapshots[0], int):
+        return snapshots[0] - 1, snapshots[1]
+
+    time = pd.read_csv(path + el_file + ".csv", usecols=["time"])["time"]
+
+    return locate(infer_index(time).asi8, snapshots)
+
+
+def timeseries_tasks(path, el_file, offset, start, stop, cache=True):
+    stop_offset = None if stop is None else offset + stop
+    el_fn = el_file + ".csv"
+
+    return {
+        el_fn: (read_rows, (path + el_fn, start, stop, "time", cache)),
+        "heat_load_synth.csv": (
+            read_rows,
+            (path + "heat_load_synth.csv", offset + start, stop_offset, "time", cache),
+        ),
+        "gas_load.csv": (
+            read_rows,
+            (path + "gas_load.csv", offset + start, stop_offset, "time", cache),
+        ),
+        "pv_timeseries.csv": (
+            read_rows,
+            (path + "pv_timeseries.csv", offset + start, stop_offset, None, cache),
+        ),
+    }
+
+
+def collect_timeseries(results, el_file, default, start):
+    el_loads = results[el_file + ".csv"]
+    stop = start + len(el_loads)
+    el_loads.index = infer_index(el_loads.index, default[start:stop])
+    index = el_loads.index
+
+    heat_load = results["heat_load_synth.csv"][: len(index)]
+    heat_load.index = index
+
+    gas_load = results["gas_load.csv"][: len(index)]
+    gas_load.index = index
+
+    pv = results["pv_timeseries.csv"][: len(index)]
+    pv = pd.Series(pv["p_max_pu"].values, index=index)
 
     return el_loads, heat_load, gas_load, pv
 
 
+def import_timeseries(
+    path="data/timeseries/",
+    use_real_data=False,
+    cache=True,
+    snapshots=None,
+    store=None,
+    parallel=True,
+    load_times=None,
+):
+    default, el_file, offset = timeseries_settings(use_real_data)
+
+    if store is not None:
+        return import_timeseries_store(store, el_file, offset, snapshots, default)
+
+    start, stop = timeseries_window(path, el_file, snapshots)
+    tasks = timeseries_tasks(path, el_file, offset, start, stop, cache)
+    results = run_tasks(tasks, parallel, load_times)
+
+    return collect_timeseries(results, el_file, default, start)
+
+
+def import_inputs(
+    path="data/",
+    use_real_data=False,
+    cache=True,
+    snapshots=None,
+    store=None,
+    parallel=True,
+    crs=None,
+):
+    # Komponenten und Zeitreihen gemeinsam im Thread-Pool einlesen
+    load_times = {}
+    x = time.time()
+
+    ts_path = path + "/timeseries/"
+    default, el_file, offset = timeseries_settings(use_real_data)
+
+    tasks = data_tasks(path, cache, crs)
+
+    if store is None:
+        start, stop = timeseries_window(ts_path, el_file, snapshots)
+        tasks.update(timeseries_tasks(ts_path, el_file, offset, start, stop, cache))
+
+    results = run_tasks(tasks, parallel, load_times)
+    data = collect_data(results)
+
+    if store is None:
+        timeseries = collect_timeseries(results, el_file, default, start)
+    else:
+        timeseries = import_timeseries_store(store, el_file, offset, snapshots, default)
+
+    print("Time for data import [s]:", round(time.time() - x, 2))
+    for name, t in sorted(load_times.items(), key=lambda item: -item[1]):
+        print("  " + name + ":", round(t, 3))
+
+    return data, timeseries
+
+
+def import_timeseries_store(store, el_file, offset, snapshots, default):
+    values, time, _ = open_timeseries(store, el_file)
+
+    if len(time) == 0:
+        time = default.asi8
+
+    start, stop = locate(time, snapshots, len(values))
+    index = pd.DatetimeIndex(time[start:stop])
+
+    # Sichten auf die memory-mapped Arrays, die übrigen Zeitreihen über ihren
+    # eigenen Zeitindex
+    el_loads = read_window(store, el_file, start, stop, index)
+
+    windows = {}
+    for name in ["heat_load_synth", "gas_load", "pv_timeseries"]:
+        window = align_window(store, name, index, offset + start, offset + stop)
+        windows[name] = read_window(store, name, *window, index)
+
+    return (
+        el_loads,
+        windows["heat_load_synth"],
+        windows["gas_load"],
+        windows["pv_timeseries"]["p_max_pu"],
+    )
+
+
 def create_pypsa_network(
     buses,
     lines,
@@ -109,20 +328,354 @@ def create_pypsa_network(
     heat_load,
     gas_load,
     pv,
-    use_real_data=False,
+    bulk=True,
 ):
     network = pypsa.Network()
 
-    if use_real_data:
-        network.set_snapshots(
-            pd.date_range("2023-02-15 00:00", "2023-11-07 10:00", freq="H")
+    # Snapshots entsprechen dem eingelesenen Zeitraum der Zeitreihen
+    network.set_snapshots(el_loads.index)
+
+    if bulk:
+        add_components(
+            network,
+            buses,
+            lines,
+            generators,
+            storage_units,
+            stores,
+            links,
+            loads,
+            el_loads,
+            heat_load,
+            gas_load,
+            pv,
         )
+    else:
+        add_components_iterative(
+            network,
+            buses,
+            lines,
+            generators,
+            storage_units,
+            stores,
+            links,
+            loads,
+            el_loads,
+            heat_load,
+            gas_load,
+            pv,
+        )
+
+    return network
+
+
+def input_files(path="data/", use_real_data=False, store=None):
+    ts_path = path + "/timeseries/"
+    _, el_file, _ = timeseries_settings(use_real_data)
+
+    files = [
+        path + fn
+        for fn in [
+            "buses.csv",
+            "lines.csv",
+            "generators.csv",
+            "storage_units.csv",
+            "stores.csv",
+            "links.csv",
+            "loads.csv",
+        ]
+    ]
+
+    timeseries = [el_file, "heat_load_synth", "gas_load", "pv_timeseries"]
+
+    if store is None:
+        files += [ts_path + name + ".csv" for name in timeseries]
+    else:
+        # die Metadaten des Speichers enthalten die Signaturen der Quelldateien
+        files += [os.path.join(store, name + ".json") for name in timeseries]
 
+    # Änderungen am Aufbau des Networks sowie am Einlesen (Cache, Zeitreihen)
+    # invalidieren ebenfalls den Cache
+    here = os.path.dirname(os.path.abspath(__file__))
+    files += [os.path.join(here, fn) for fn in ["data.py", "cache.py", "timeseries.py"]]
+
+    return files
+
+
+def build_network(args):
+    x = time.time()
+
+    if args["load_window"]:
+        window = (args["start_snapshot"], args["end_snapshot"])
     else:
-        network.set_snapshots(
-            pd.date_range("2019-01-01 00:00", "2019-12-31 23:00", freq="H")
+        window = None
+
+    if args["network_cache"]:
+        settings = {
+            "use_real_data": args["use_real_data"],
+            "snapshots": window,
+            "crs": args["crs"],
+            "pypsa": pypsa.__version__,
+        }
+        files = input_files(args["path"], args["use_real_data"], args["store"])
+        fn = network_cache_path(args["path"], network_key(files, settings))
+
+        if os.path.isfile(fn):
+            with phase("network cache"):
+                network = load_network(fn)
+            print("Time for network from cache [s]:", round(time.time() - x, 2))
+
+            apply_overrides(network, args.get("overrides"))
+
+            return network
+
+    with phase("data import"):
+        (
+            (buses, lines, generators, storage_units, stores, links, loads),
+            (el_loads, heat_load, gas_load, pv),
+        ) = import_inputs(
+            args["path"],
+            args["use_real_data"],
+            args["cache"],
+            window,
+            args["store"],
+            crs=args["crs"],
         )
 
+    with phase("network build"):
+        network = create_pypsa_network(
+            buses,
+            lines,
+            generators,
+            storage_units,
+            stores,
+            links,
+            loads,
+            el_loads,
+            heat_load,
+            gas_load,
+            pv,
+        )
+
+    if args["network_cache"]:
+        with phase("network cache"):
+            save_network(network, fn)
+
+    print("Time for network build [s]:", round(time.time() - x, 2))
+
+    apply_overrides(network, args.get("overrides"))
+
+    return network
+
+
+def apply_overrides(network, overrides):
+    # Komponentenparameter nach dem Aufbau überschreiben (nicht im Cache), z.B.
+    # {"Generator": {"NeAn": {"marginal_cost": 0.3}}}
+    if not overrides:
+        return
+
+    for component, names in overrides.items():
+        df = network.df(component)
+
+        for name, attrs in names.items():
+            if name not in df.index:
+                raise ValueError(component + " " + name + " nicht im Network.")
+
+            for attr, value in attrs.items():
+                df.loc[name, attr] = value
+
+
+def add_components(
+    network,
+    buses,
+    lines,
+    generators,
+    storage_units,
+    stores,
+    links,
+    loads,
+    el_loads,
+    heat_load,
+    gas_load,
+    pv,
+):
+    # Alle Komponenten einer Klasse werden mit einem madd-Aufruf hinzugefügt,
+    # Zeitreihen als spaltenweise ausgerichtete DataFrames
+
+    # Buses
+
+    if "geometry" in buses.columns:
+        network.madd(
+            "Bus",
+            buses.index,
+            carrier=buses.carrier,
+            v_nom=buses.v_nom,
+            x=buses.x,
+            y=buses.y,
+        )
+    else:
+        network.madd(
+            "Bus",
+            buses.index,
+            carrier=buses.carrier,
+            v_nom=buses.v_nom,
+        )
+
+    # Lines
+
+    network.madd(
+        "Line",
+        lines.index,
+        type=lines.type,
+        bus0=lines.bus0,
+        bus1=lines.bus1,
+        s_nom_extendable=lines.s_nom_extendable,
+        s_nom_min=lines.s_nom_min,
+        s_nom=lines.s_nom,
+        length=lines.length,
+        capital_cost=lines.capital_cost,
+    )
+
+    # Generation
+
+    pv_gens = generators.index[generators.carrier == "PV"]
+
+    network.madd(
+        "Generator",
+        generators.index,
+        carrier=generators.carrier,
+        bus=generators.bus,
+        control=generators.control,
+        p_nom=generators.p_nom,
+        p_nom_min=generators.p_nom_min,
+        p_nom_max=generators.p_nom_max,
+        p_nom_extendable=generators.p_nom_extendable,
+        marginal_cost=generators.marginal_cost,
+        capital_cost=generators.capital_cost,
+        p_max_pu=pd.DataFrame({gen: pv for gen in pv_gens}, index=network.snapshots),
+    )
+
+    # Storage Units
+
+    network.madd(
+        "StorageUnit",
+        storage_units.index,
+        carrier=storage_units.carrier,
+        bus=storage_units.bus,
+        p_nom_extendable=storage_units.p_nom_extendable,
+        p_nom=storage_units.p_nom,
+        p_nom_min=storage_units.p_nom_min,
+        max_hours=storage_units.max_hours,
+        standing_loss=storage_units.standing_loss,
+        efficiency_store=storage_units.efficiency_store,
+        efficiency_dispatch=storage_units.efficiency_dispatch,
+        cyclic_state_of_charge=storage_units.cyclic_state_of_charge,
+        marginal_cost=storage_units.marginal_cost,
+        capital_cost=storage_units.capital_cost,
+    )
+
+    # Stores
+
+    network.madd(
+        "Store",
+        stores.index,
+        carrier=stores.carrier,
+        bus=stores.bus,
+        e_nom_extendable=stores.e_nom_extendable,
+        e_nom=stores.e_nom,
+        e_nom_min=stores.e_nom_min,
+        standing_loss=stores.standing_loss,
+        e_cyclic=stores.e_cyclic,
+        marginal_cost=stores.marginal_cost,
+        capital_cost=stores.capital_cost,
+    )
+
+    # Links
+
+    network.madd(
+        "Link",
+        links.index,
+        carrier=links.carrier,
+        bus0=links.bus0,
+        bus1=links.bus1,
+        p_nom_extendable=links.p_nom_extendable,
+        p_nom=links.p_nom,
+        p_nom_min=links.p_nom_min,
+        efficiency=links.efficiency,
+        marginal_cost=links.marginal_cost,
+        capital_cost=links.capital_cost,
+    )
+    network.links["kwk_pair"] = kwk_pairs(links)
+
+    # Loads
+
+    network.madd(
+        "Load",
+        loads.index,
+        carrier=loads.carrier,
+        bus=loads.bus,
+        p_set=load_timeseries(loads, el_loads, heat_load, gas_load),
+    )
+
+
+def kwk_pairs(links):
+    # Zuordnung der Wärme-Links zu den elektrischen Links der KWK-Anlagen aus der
+    # Spalte kwk_pair, alternativ über die Namen <Anlage>_AC und <Anlage>_W
+    pairs = pd.Series("", index=links.index, dtype=object)
+    electric = links.index[links.carrier == "KWK_AC"]
+
+    if "kwk_pair" in links.columns:
+        pairs[electric] = links.loc[electric, "kwk_pair"].fillna("")
+    else:
+        pairs[electric] = electric.str.replace(r"_AC$", "_W", regex=True)
+
+    heat = links.index[links.carrier == "KWK_heat"]
+    missing = pairs[electric][~pairs[electric].isin(heat)]
+
+    if not missing.empty:
+        raise ValueError(
+            "Kein Wärme-Link für KWK-Anlage(n) gefunden: " + ", ".join(missing.index)
+        )
+
+    return pairs
+
+
+def load_timeseries(loads, el_loads, heat_load, gas_load):
+    # elektrische Lasten sind den Bussen zugeordnet, Wärme- und Gaslasten
+    # den Namen der Lasten
+    ac = loads.index[loads.carrier == "AC"]
+    heat = loads.index[loads.carrier == "heat"]
+    gas = loads.index[(loads.carrier != "AC") & (loads.carrier != "heat")]
+
+    p_set = pd.concat(
+        [
+            el_loads[loads.bus[ac]].set_axis(ac, axis=1),
+            heat_load[heat],
+            gas_load[gas],
+        ],
+        axis=1,
+    )
+
+    return p_set[loads.index]
+
+
+def add_components_iterative(
+    network,
+    buses,
+    lines,
+    generators,
+    storage_units,
+    stores,
+    links,
+    loads,
+    el_loads,
+    heat_load,
+    gas_load,
+    pv,
+):
+    # Ursprünglicher Aufbau mit einem add-Aufruf je Komponente, dient als
+    # Referenz für add_components (siehe benchmark.compare_network_build)
+
     # Buses
     
     if 'geometry' in buses.columns:
@@ -255,6 +808,7 @@ def create_pypsa_network(
             marginal_cost=link.marginal_cost,
             capital_cost=link.capital_cost,
         )
+    network.links["kwk_pair"] = kwk_pairs(links)
 
     # Loads
 
@@ -284,5 +838,3 @@ def create_pypsa_network(
                 bus=load.bus,
                 p_set=gas_load[load.name],
             )
-
-    return network
@@ -0,0 +1,433 @@
+# -*- coding: utf-8 -*-
+# Copyright 2023
+# Europa-Universität Flensburg,
+# Centre for Sustainable Energy Systems
+
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation; either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# File description
+"""
+This file contains the functions to export the results of the optimization
+in a background thread into a compressed HDF5 store, writing only the tables
+that changed since the previous export, and to read them again, either as a
+whole network or only selected components, attributes and time ranges.
+"""
+
+import os
+import re
+import json
+import pickle
+import hashlib
+import functools
+import pandas as pd
+import pypsa
+
+from concurrent.futures import ThreadPoolExecutor
+from pypsa.components import components
+from pypsa.io import Exporter, Importer, _export_to_exporter, _import_from_importer
+
+from profiling import phase
+from timeseries import locate
+
+__copyright__ = (
+    "Europa-Universität Flensburg, Centre for Sustainable Energy Systems, "
+    "FossilExit Research Group"
+)
+__license__ = "GNU Affero General Public License Version 3 (AGPL-3.0)"
+__author__ = "KathiEsterl"
+
+
+STORE = "results.h5"
+MANIFEST = "manifest.json"
+
+# aktiver Export-Thread der laufenden Optimierung (None: kein Export aktiv)
+writer = None
+
+
+def table_hash(df):
+    sha = hashlib.sha256()
+
+    sha.update(repr(list(df.columns) if df.ndim > 1 else df.name).encode())
+    try:
+        sha.update(pd.util.hash_pandas_object(df, index=True).values.tobytes())
+    except TypeError:
+        # gemischte Datentypen in object-Spalten
+        sha.update(pickle.dumps(df))
+
+    return sha.hexdigest()
+
+
+class TableCollector(Exporter):
+    # sammelt die Tabellen eines Networks wie export_to_hdf5, die Tabellen
+    # sind Kopien und können im Hintergrund geschrieben werden
+    def __init__(self):
+        self.tables = {}
+        self.snapshots = None
+
+    def save_attributes(self, attrs):
+        name = attrs.pop("name")
+        self.tables["network"] = pd.DataFrame(
+            attrs, index=pd.Index([name], name="name")
+        )
+
+    def save_meta(self, meta):
+        self.tables["meta"] = pd.Series(json.dumps(meta))
+
+    def save_snapshots(self, snapshots):
+        self.tables["snapshots"] = snapshots
+        if "snapshot" in snapshots.columns:
+            self.snapshots = pd.Index(snapshots["snapshot"], name="snapshot")
+
+    def save_investment_periods(self, investment_periods):
+        self.tables["investment_periods"] = investment_periods.copy()
+
+    def save_static(self, list_name, df):
+        self.tables[list_name] = df.reset_index()
+
+    def save_series(self, list_name, attr, df):
+        # Zeitreihen mit Snapshots als Index, damit Zeitfenster gelesen werden
+        # können, ohne das Network aufzubauen
+        if self.snapshots is not None:
+            df = df.set_axis(self.snapshots)
+
+        self.tables[list_name + "_t/" + attr] = df
+
+
+class ResultWriter:
+    # alle Exporte eines Laufs landen in einem HDF5-Speicher, je Export wird
+    # ein Manifest mit den Schlüsseln der aktuellen Tabellen abgelegt
+    def __init__(self, fn, complib="blosc:zstd", complevel=5):
+        self.fn = fn
+        self.complib = complib
+        self.complevel = complevel
+        self.store = None
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.futures = []
+        self.hashes = {}
+        self.keys = {}
+        self.counter = 0
+        # an bestehenden Speicher anhängen (fortgesetzter Lauf), die Manifeste
+        # der früheren Exporte bleiben gültig
+        self.append = False
+
+    def submit(self, network, path):
+        collector = TableCollector()
+        _export_to_exporter(network, collector, basename=path)
+
+        self.futures.append(self.executor.submit(self.write, collector.tables, path))
+
+    def write(self, tables, path):
+        if self.store is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.fn)), exist_ok=True)
+            if not self.append:
+                remove_manifests(self.fn)
+
+            self.store = pd.HDFStore(
+                self.fn,
+                mode="a" if self.append else "w",
+                complib=self.complib,
+                complevel=self.complevel,
+            )
+
+            # Versionen der bestehenden Tabellen fortzählen
+            versions = [re.search(r"/v(\d+)$", key) for key in self.store.keys()]
+            self.counter = max([int(v.group(1)) for v in versions if v], default=0)
+
+        self.counter += 1
+
+        # leere Tabellen (z.B. ohne Investitionsperioden) werden nicht abgelegt
+        tables = {key: df for key, df in tables.items() if not df.empty}
+
+        # nur Tabellen schreiben, die sich seit dem letzten Export geändert haben
+        for key, df in tables.items():
+            sha = table_hash(df)
+
+            if self.hashes.get(key) != sha:
+                self.keys[key] = key + "/v" + str(self.counter)
+                # eine Tabelle je Komponente und Attribut, in Blöcken von
+                # Zeilen (Snapshots) komprimiert
+                self.store.append(
+                    self.keys[key],
+                    df,
+                    index=False,
+                    expectedrows=len(df),
+                )
+                self.hashes[key] = sha
+
+        self.store.flush()
+
+        manifest = {
+            "store": os.path.relpath(self.fn, path),
+            "tables": {key: self.keys[key] for key in tables},
+        }
+
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, MANIFEST), "w") as f:
+            json.dump(manifest, f, indent=2)
+
+    def flush(self):
+        futures, self.futures = self.futures, []
+
+        for future in futures:
+            future.result()
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            self.executor.shutdown()
+            if self.store is not None:
+                self.store.close()
+
+
+def remove_manifests(fn):
+    # Manifeste früherer Läufe verweisen auf Versionen des Speichers, der
+    # neu angelegt wird, z.B. lopf_iteration_3 eines längeren Laufs
+    store = os.path.abspath(fn)
+
+    for root, _, files in os.walk(os.path.dirname(store)):
+        if MANIFEST not in files:
+            continue
+
+        manifest_fn = os.path.join(root, MANIFEST)
+        try:
+            with open(manifest_fn) as f:
+                target = json.load(f)["store"]
+        except (ValueError, KeyError):
+            continue
+
+        if os.path.abspath(os.path.join(root, target)) == store:
+            os.remove(manifest_fn)
+
+
+def start_export(args):
+    global writer
+
+    if args.get("export", "csv") == "hdf5":
+        writer = ResultWriter(os.path.join(args["csv_export"], STORE))
+
+    return writer
+
+
+def resume_export():
+    # vor dem ersten Export eines fortgesetzten Laufs aufrufen
+    if writer is not None:
+        writer.append = True
+
+
+def stop_export():
+    global writer
+
+    if writer is not None:
+        try:
+            with phase("export flush"):
+                writer.close()
+        finally:
+            writer = None
+
+
+def export_network(network, path, args):
+    with phase("export"):
+        if args.get("export", "csv") != "hdf5":
+            network.export_to_csv_folder(path)
+
+        elif writer is not None:
+            writer.submit(network, path)
+
+        else:
+            # außerhalb von optimization(): direkt in den Exportordner schreiben
+            single = ResultWriter(os.path.join(path, STORE))
+            single.submit(network, path)
+            single.close()
+
+
+class ResultImporter(Importer):
+    def __init__(self, path):
+        with open(os.path.join(path, MANIFEST)) as f:
+            manifest = json.load(f)
+
+        self.ds = pd.HDFStore(os.path.join(path, manifest["store"]), mode="r")
+        self.tables = manifest["tables"]
+
+    def get(self, key):
+        return self.ds[self.tables[key]] if key in self.tables else None
+
+    def get_attributes(self):
+        return dict(self.get("network").reset_index().iloc[0])
+
+    def get_meta(self):
+        meta = self.get("meta")
+        return json.loads(meta[0]) if meta is not None else {}
+
+    def get_snapshots(self):
+        return self.get("snapshots")
+
+    def get_investment_periods(self):
+        return self.get("investment_periods")
+
+    def get_static(self, list_name):
+        df = self.get(list_name)
+        return df.set_index("name") if df is not None else None
+
+    def get_series(self, list_name):
+        for key in self.tables:
+            if key.startswith(list_name + "_t/"):
+                yield key[len(list_name + "_t/") :], self.get(key)
+
+
+def import_results(path):
+    network = pypsa.Network()
+
+    with ResultImporter(path) as importer:
+        _import_from_importer(network, importer, basename=path)
+
+    return network
+
+
+# Komponenten nach list_name, z.B. "storage_units": "StorageUnit"
+LIST_NAMES = dict(zip(components.list_name, components.index))
+
+
+@functools.lru_cache()
+def empty_network():
+    return pypsa.Network()
+
+
+def attributes(list_name):
+    # Attribute mit Standardwerten aus einem leeren Network
+    return empty_network().components[LIST_NAMES[list_name]]["attrs"]
+
+
+class ResultSeries:
+    # entspricht network.<list_name>_t, z.B. network.storage_units_t
+    def __init__(self, results, list_name):
+        self.results = results
+        self.list_name = list_name
+
+    def __getattr__(self, attr):
+        if attr.startswith("_"):
+            raise AttributeError(attr)
+
+        return self.results.series(self.list_name, attr)
+
+    def __getitem__(self, attr):
+        return self.results.series(self.list_name, attr)
+
+
+class ResultNetwork:
+    # Ergebnisse eines Exportordners mit der Schnittstelle eines Networks für
+    # results.py und plots.py, Tabellen werden erst beim Zugriff und nur für
+    # das gewählte Zeitfenster gelesen
+    def __init__(self, path, snapshots=None):
+        # snapshots: (Start, Ende) als Positionen wie in args oder Zeitpunkte
+        self.importer = ResultImporter(path)
+        self.cache = {}
+
+        weightings = self.importer.get_snapshots().set_index("snapshot")
+        index = weightings.index
+
+        if isinstance(index, pd.DatetimeIndex):
+            index = index.asi8
+
+        self.start, self.stop = locate(index, snapshots, len(weightings))
+
+        self.snapshot_weightings = weightings.iloc[self.start : self.stop]
+        self.snapshots = self.snapshot_weightings.index
+
+        self.objective = self.importer.get_attributes().get("objective", float("nan"))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        self.importer.ds.close()
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+
+        if name.endswith("_t") and name[:-2] in LIST_NAMES:
+            return ResultSeries(self, name[:-2])
+
+        if name in LIST_NAMES:
+            return self.static(name)
+
+        raise AttributeError(name)
+
+    def static(self, list_name):
+        if list_name not in self.cache:
+            attrs = attributes(list_name)
+
+            df = self.importer.get_static(list_name)
+            if df is None:
+                df = pd.DataFrame(index=pd.Index([], name="name"))
+
+            # nicht exportierte Attribute haben den Standardwert
+            for attr in attrs.index[attrs.static]:
+                if attr not in df.columns:
+                    df[attr] = pd.Series(
+                        attrs.at[attr, "default"],
+                        df.index,
+                        dtype=attrs.at[attr, "dtype"],
+                    )
+
+            self.cache[list_name] = df
+
+        return self.cache[list_name]
+
+    def series(self, list_name, attr, columns=None):
+        key = list_name + "_t/" + attr
+        tag = (key, None if columns is None else tuple(columns))
+
+        if tag in self.cache:
+            return self.cache[tag]
+
+        if key in self.importer.tables:
+            table = self.importer.tables[key]
+            stored = self.importer.ds.get_storer(table).non_index_axes[0][1]
+
+            # nur die angefragten Snapshots und Spalten lesen
+            df = self.importer.ds.select(
+                table,
+                start=self.start,
+                stop=self.stop,
+                columns=(
+                    None if columns is None else [c for c in columns if c in stored]
+                ),
+            )
+            df.index = self.snapshots
+        else:
+            df = pd.DataFrame(index=self.snapshots)
+
+        # Ergebnisse ohne Werte ungleich dem Standardwert wurden nicht exportiert
+        attrs = attributes(list_name)
+        if attr in attrs.index and attrs.at[attr, "status"].startswith("Output"):
+            names = self.static(list_name).index if columns is None else columns
+            df = df.reindex(columns=names, fill_value=attrs.at[attr, "default"])
+
+        df.columns.name = LIST_NAMES[list_name]
+
+        self.cache[tag] = df
+
+        return df
+
+
+def read_series(path, list_name, attr, columns=None, snapshots=None):
+    # z.B. read_series(path, "storage_units", "state_of_charge", ["Bat"],
+    # ("2019-07-01", "2019-07-31 23:00"))
+    with ResultNetwork(path, snapshots) as results:
+        return results.series(list_name, attr, columns)
@@ -23,10 +23,11 @@ This is the application file for the tool OptIES.
 
 import pypsa
 
-from data import import_data, import_timeseries, create_pypsa_network
+from data import build_network
 from optimization import Constraints, optimization
 from results import calc_results
 from plots import *
+from profiling import start_profiling, stop_profiling
 
 __copyright__ = (
     "Europa-Universität Flensburg, Centre for Sustainable Energy Systems, "
@@ -39,13 +40,45 @@ __author__ = "KathiEsterl, MatthiasW, mohsenmansouri"
 args = {
     "path": "data/",
     "use_real_data": False,
+    "cache": True,  # binärer Cache der eingelesenen csv-Dateien
+    "store": None,  # memory-mapped Zeitreihenspeicher (timeseries.build_store)
+    "crs": None,  # Projektion der Bus-Koordinaten, z.B. "EPSG:25832"
+    "network_cache": True,  # aufgebautes Network zwischenspeichern
     "start_snapshot": 1,  # comparison with real_data: 1081
     "end_snapshot": 8760,  # comparison with real_data: 7451
+    "load_window": True,  # nur Zeitfenster start_snapshot:end_snapshot einlesen
+    # typische Zeiträume statt aller Snapshots optimieren, z.B.
+    # {"n_clusters": 12, "period_length": 24, "method": "kmedoids"} (nur pyomo)
+    "aggregation": None,
+    # Einsatzoptimierung mit festen Kapazitäten in aufeinanderfolgenden
+    # Zeitfenstern, z.B. {"window": 168, "overlap": 24}
+    "rolling_horizon": None,
+    # Kapazitäten auf reduzierter Zeitauflösung, danach Einsatz in voller
+    # Auflösung, z.B. {"resolution": 3} oder {"n_clusters": 12} (nur pyomo)
+    "two_stage": None,
+    # Einsatzoptimierung bei festen Kapazitäten in parallelen Zeitblöcken, z.B.
+    # {"block": 168, "resolution": 24, "n_jobs": None}
+    "decomposition": None,
+    # Anlagenparameter, z.B. {"c_v": 0.2, "c_m": 0.75, "ta_target": 2976}
+    "plant": None,
+    # Komponentenparameter überschreiben, z.B.
+    # {"Generator": {"NeAn": {"marginal_cost": 0.3}}}
+    "overrides": None,
     "method": {
-        "type": "lopf",
-        "n_iter": 4,
+        "type": "lopf",  # "lopf" (pyomo/nomopyomo) oder "optimize" (linopy)
+        "n_iter": 4,  # maximale Anzahl an Iterationen
+        "tolerance": 1e-3,  # rel. Änderung von s_nom_opt und Zielfunktion
         "pyomo": True,
+        "persistent": False,  # pyomo-Modell über die Iterationen wiederverwenden
+        "in_memory": False,  # Modell ohne LP-Datei an den Solver übergeben
+        "reduce": False,  # auf 0 festgelegte Variablen vor dem Lösen entfernen
+        # Koeffizientenbereiche je Familie von Nebenbedingungen ausgeben
+        # ("report", conditioning.csv) und das Modell skalieren ("scale", linopy)
+        "conditioning": None,
     },
+    # gespeichertes Solver-Profil aus tuning.tune_solvers (Name oder JSON-Datei),
+    # ersetzt solver_name und solver_options
+    "solver_profile": None,
     "solver_name": "gurobi",
     "solver_options": {
         "BarConvTol": 1e-05,
@@ -57,32 +90,26 @@ args = {
         "BarHomogeneous": 1,
     },
     "csv_export": "opties_results/",
+    # "csv": csv-Ordner, "hdf5": Export im Hintergrund, nur geänderte Tabellen,
+    # komprimiert in results.h5 (einlesen mit export.import_results)
+    "export": "csv",
+    # nach jeder Iteration der Leitungsimpedanzen Checkpoint im Exportordner,
+    # ein erneuter Lauf mit denselben args setzt dort fort
+    "checkpoint": False,
+    # Laufzeit und Speicherbedarf je Phase als JSON im Exportordner, z.B.
+    # {"cprofile": False, "tracemalloc": False}
+    "profiling": None,
 }
 
+# Hauptprogramm nur beim direkten Aufruf ausführen, die Prozesse von
+# decomposed_dispatch importieren diese Datei erneut
+if __name__ == "__main__":
+    start_profiling(args)
 
-buses, lines, generators, storage_units, stores, links, loads = import_data(
-    args["path"]
-)
-
-el_loads, heat_load, gas_load, pv = import_timeseries(
-    args["path"] + "/timeseries/", args["use_real_data"]
-)
+    network = build_network(args)
 
-network = create_pypsa_network(
-    buses,
-    lines,
-    generators,
-    storage_units,
-    stores,
-    links,
-    loads,
-    el_loads,
-    heat_load,
-    gas_load,
-    pv,
-    args["use_real_data"],
-)
+    optimization(network, args)
 
-optimization(network, args)
+    results = calc_results(network)
 
-results = calc_results(network)
+    stop_profiling(args)
@@ -1,297 +1,1391 @@
-# -*- coding: utf-8 -*-
-# Copyright 2023
-# Europa-Universität Flensburg,
-# Centre for Sustainable Energy Systems
-
-# This program is free software; you can redistribute it and/or
-# modify it under the terms of the GNU Affero General Public License as
-# published by the Free Software Foundation; either version 3 of the
-# License, or (at your option) any later version.
-
-# This program is distributed in the hope that it will be useful,
-# but WITHOUT ANY WARRANTY; without even the implied warranty of
-# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
-# GNU Affero General Public License for more details.
-
-# You should have received a copy of the GNU Affero General Public License
-# along with this program.  If not, see <http://www.gnu.org/licenses/>.
-
-# File description
-"""
-This file contains the functions related to the optimization.
-"""
-
-import time
-import math
-from pypsa.linopt import get_var, linexpr, define_constraints
-from pyomo.environ import Constraint
-
-__copyright__ = (
-    "Europa-Universität Flensburg, Centre for Sustainable Energy Systems, "
-    "FossilExit Research Group"
-)
-__license__ = "GNU Affero General Public License Version 3 (AGPL-3.0)"
-__author__ = "KathiEsterl, mohsenmansouri"
-
-
-def optimization(network, args):
-    method = args["method"]
-    path = args["csv_export"]
-
-    # Effizienzen der Wärme-Links der KWK-Anlagen an extra KWK-Constraints anpassen
-    # (bevor pyomo.model erstellt wird an dieser Stelle)
-    c_v = 0.2  # marginal loss for each additional generation of heat
-    # KWK: elektrische und Wärme-Links
-    electric_bool = network.links.carrier == "KWK_AC"
-    heat_bool = network.links.carrier == "KWK_heat"
-    electric_links = network.links.index[electric_bool]
-    heat_links = network.links.index[heat_bool]
-    # Effizienzen Wärme-Links
-    network.links.loc[heat_links, "efficiency"] = (
-        network.links.loc[electric_links, "efficiency"] / c_v
-    ).values.mean()
-
-    ext = network.lines[network.lines.s_nom_extendable]
-
-    if not ext.empty:
-        # s_nom_pre = s_nom_opt of previous iteration
-        l_snom_pre = network.lines.s_nom.copy()
-
-        # calculate fixed number of iterations
-        n_iter = method["n_iter"]
-
-        for i in range(1, (1 + n_iter)):
-            run_lopf(network, args, Constraints(args).extra_functionalities)
-
-            path_it = path + "/lopf_iteration_" + str(i)
-            network.export_to_csv_folder(path_it)
-
-            # adapt s_nom per iteration
-            if i < n_iter:
-                network.lines.loc[network.lines.s_nom_extendable].x = (
-                    network.lines.x * l_snom_pre / network.lines.s_nom_opt
-                )
-
-                network.lines.loc[network.lines.s_nom_extendable].r = (
-                    network.lines.r * l_snom_pre / network.lines.s_nom_opt
-                )
-
-                network.lines.loc[network.lines.s_nom_extendable].g = (
-                    network.lines.g * network.lines.s_nom_opt / l_snom_pre
-                )
-
-                network.lines.loc[network.lines.s_nom_extendable].b = (
-                    network.lines.b * network.lines.s_nom_opt / l_snom_pre
-                )
-
-                # Set snom_pre to s_nom_opt for next iteration
-                l_snom_pre = network.lines.s_nom_opt.copy()
-
-    else:
-        run_lopf(network, args, Constraints(args).extra_functionalities)
-
-
-def run_lopf(network, args, extra_functionality):
-    x = time.time()
-
-    # snapshots
-    start = args["start_snapshot"] - 1
-    end = args["end_snapshot"]
-
-    network.lopf(
-        snapshots=network.snapshots[start:end],
-        pyomo=args["method"]["pyomo"],
-        solver_name=args["solver_name"],
-        solver_options=args["solver_options"],
-        extra_functionality=extra_functionality,
-    )
-
-    if math.isnan(network.objective):
-        raise Exception("LOPF nicht gelöst.")
-
-    y = time.time()
-    z = (y - x) / 60
-
-    print("Time for LOPF [min]:", round(z, 2))
-
-    network.export_to_csv_folder(args["csv_export"])
-
-
-def kwk_constraints_nmp(n, sns):
-    # Konstanten
-    nom_r = 1  # ratio between max heat output and max electric output
-    c_m = 0.75  # backpressure limit
-    # c_v = 0.2  # marginal loss for each additional generation of heat
-    # Effizienzen der Wärme-Links bereits im Vorwege angepasst (bevor pyomo.model erstellt wird)
-
-    # KWK: elektrische und Wärme-Links
-    electric_bool = n.links.carrier == "KWK_AC"
-    heat_bool = n.links.carrier == "KWK_heat"
-    electric_links = n.links.index[electric_bool]
-    heat_links = n.links.index[heat_bool]
-
-    # Zusammengehörigkeit der elektrischen und Wärme-Links
-    el_ht = {"KWK1_AC": "KWK1_W", "KWK2_AC": "KWK2_W", "KWK3_AC": "KWK3_W"}
-
-    # bei Ausbau der BHKWs
-
-    if n.links.loc[electric_links, "p_nom_extendable"].any():
-        link_pnom = get_var(n, "Link", "p_nom")
-
-        for elec in electric_links:
-            heat = el_ht[elec]
-
-            lhs1 = n.links.loc[elec, "efficiency"] * nom_r * link_pnom[elec]
-            lhs2 = n.links.loc[heat, "efficiency"] * link_pnom[heat]
-
-            lhs = linexpr((1, lhs1), (-1, lhs2))
-            define_constraints(n, lhs, "==", 0, "heat-power output proportionality")
-
-    # Leistung an Links (Optimierungsvariable)
-    link_p = get_var(n, "Link", "p")
-
-    for el in electric_links:
-        ht = el_ht[el]
-
-        # Verhältnis aus Strom- und Wärmeoutput
-
-        lhs_1 = c_m * n.links.at[ht, "efficiency"] * link_p[ht]
-        lhs_2 = n.links.at[el, "efficiency"] * link_p[el]
-
-        lhs = linexpr((1, lhs_1), (-1, lhs_2))
-        define_constraints(n, lhs, "<=", 0, "chplink_" + str(el), "backpressure")
-
-        # Constraints zur Begrenzung des Biogaseinsatzes für Strom- und Wärmeoutput
-        # top_iso_fuel_line
-
-        lhs, *ax = linexpr(
-            (1, link_p[ht]),
-            (1, link_p[el]),
-            return_axes=True,
-        )
-
-        define_constraints(
-            n,
-            lhs,
-            "<=",
-            n.links.loc[el].p_nom.sum(),
-            "chplink_" + str(el),
-            "top_iso_fuel_line_fix",
-            axes=ax,
-        )
-
-
-def kwk_constraints_pyomo(n, sns):
-    # Konstanten
-    nom_r = 1  # ratio between max heat output and max electric output
-    c_m = 0.75  # backpressure limit
-    # c_v = 0.2  # marginal loss for each additional generation of heat
-    # Effizienzen der Wärme-Links bereits im Vorwege angepasst (bevor pyomo.model erstellt wird)
-
-    # KWK: elektrische und Wärme-Links
-    electric_bool = n.links.carrier == "KWK_AC"
-    heat_bool = n.links.carrier == "KWK_heat"
-    electric_links = n.links.index[electric_bool]
-    heat_links = n.links.index[heat_bool]
-
-    # Zusammengehörigkeit der elektrischen und Wärme-Links
-    el_ht = {"KWK1_AC": "KWK1_W", "KWK2_AC": "KWK2_W", "KWK3_AC": "KWK3_W"}
-
-    # bei Ausbau der BHKWs
-    if n.links.loc[electric_links, "p_nom_extendable"].any():
-        for elec in electric_links:
-            heat = el_ht[elec]
-
-            def heat_power_output(model):
-                lhs = n.links.at[elec, "efficiency"] * nom_r * model.link_p_nom[elec]
-                rhs = n.links.at[heat, "efficiency"] * model.link_p_nom[heat]
-
-                return lhs - rhs == 0
-
-            setattr(
-                n.model,
-                "heat-power output proportionality" + str(elec),
-                Constraint(rule=heat_power_output),
-            )
-
-    for el in electric_links:
-        ht = el_ht[el]
-
-        # Verhältnis aus Strom- und Wärmeoutput
-
-        def backpressure(model, snapshot):
-            lhs = c_m * n.links.at[ht, "efficiency"] * model.link_p[ht, snapshot]
-
-            rhs = n.links.at[el, "efficiency"] * model.link_p[el, snapshot]
-
-            return lhs <= rhs
-
-        setattr(
-            n.model,
-            "backpressure_" + str(el),
-            Constraint(list(sns), rule=backpressure),
-        )
-
-        # Constraints zur Begrenzung des Biogaseinsatzes für Strom- und Wärmeoutput
-        # top_iso_fuel_line
-
-        def top_iso_fuel_line(model, snapshot):
-            lhs = (model.link_p[ht, snapshot]) + (model.link_p[el, snapshot])
-
-            rhs = n.links.loc[el].p_nom.sum()
-
-            return lhs <= rhs
-
-        setattr(
-            n.model,
-            "top_iso_fuel_line_" + str(el),
-            Constraint(list(sns), rule=top_iso_fuel_line),
-        )
-
-
-def trocknungsanlage_nmp(n, sns):
-    store_e = get_var(n, "Store", "e").loc[sns[-1]]
-
-    lhs = linexpr(
-        (1, store_e["TA"]),
-        return_axes=True,
-    )
-
-    define_constraints(
-        n,
-        lhs,
-        "==",
-        2976,
-        "Store_TA",
-        "load_trocknungsanlage",
-    )
-
-
-def trocknungsanlage_pyomo(n, sns):
-    def load_trocknungsanlage(model, snapshot):
-        lhs = n.model.store_e["TA", snapshot]
-        rhs = 2976
-
-        return lhs == rhs
-
-    setattr(
-        n.model,
-        "load_trocknungsanlage",
-        Constraint(sns[-1:], rule=load_trocknungsanlage),
-    )
-
-
-class Constraints:
-    def __init__(self, args):
-        self.args = args
-
-    def extra_functionalities(self, network, snapshots):
-        args = self.args
-
-        if args["method"]["pyomo"]:
-            kwk_constraints_pyomo(network, snapshots)
-            trocknungsanlage_pyomo(network, snapshots)
-
-        else:
-            kwk_constraints_nmp(network, snapshots)
-            trocknungsanlage_nmp(network, snapshots)
+# -*- coding: utf-8 -*-
+# Copyright 2023
+# Europa-Universität Flensburg,
+# Centre for Sustainable Energy Systems
+
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation; either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# File description
+"""
+This file contains the functions related to the optimization.
+"""
+
+import os
+import json
+import time
+import math
+import multiprocessing
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from concurrent.futures import ProcessPoolExecutor
+from pypsa.linopt import get_var, linexpr, define_constraints
+from pyomo.environ import Constraint, SolverFactory
+from pyomo.solvers.plugins.solvers.persistent_solver import PersistentSolver
+from pypsa.opf import (
+    network_lopf_build_model,
+    network_lopf_prepare_solver,
+    network_lopf_solve,
+    define_passive_branch_flows_with_kirchhoff,
+    define_linear_objective,
+)
+from pypsa.pf import calculate_dependent_values
+from pypsa.opt import LConstraint, LExpression, l_constraint
+
+from aggregation import (
+    cluster_snapshots,
+    aggregate_network,
+    downsample_network,
+    disaggregate_network,
+    inter_period_linkage_pyomo,
+    trocknungsanlage_aggregated_pyomo,
+)
+from data import kwk_pairs
+from profiling import begin, end, phase
+from export import start_export, stop_export, resume_export, export_network
+from reduction import Reduction
+from conditioning import Scaling, label_count
+from checkpoint import Checkpoint, keep_basis, warmstart_file
+
+__copyright__ = (
+    "Europa-Universität Flensburg, Centre for Sustainable Energy Systems, "
+    "FossilExit Research Group"
+)
+__license__ = "GNU Affero General Public License Version 3 (AGPL-3.0)"
+__author__ = "KathiEsterl, mohsenmansouri"
+
+
+# gespeicherte Solver-Einstellungen (tuning.tune_solvers), je Profil eine
+# JSON-Datei
+PROFILE_DIR = "solver_profiles"
+
+
+def optimization(network, args):
+    args = solver_profile(args)
+
+    # Export im Hintergrund, alle Ergebnisse sind bei Rückkehr geschrieben
+    start_export(args)
+
+    try:
+        optimize_network(network, args)
+    finally:
+        stop_export()
+
+
+def optimize_network(network, args):
+    path = args["csv_export"]
+
+    kwk_efficiencies(network, plant_parameters(args)["c_v"])
+
+    aggregation = args.get("aggregation")
+
+    if args.get("rolling_horizon"):
+        rolling_horizon(network, args)
+
+    elif args.get("two_stage"):
+        two_stage(network, args)
+
+    elif args.get("decomposition"):
+        decomposed_dispatch(network, args)
+
+    elif aggregation:
+        reduced, clustering = aggregated_lopf(network, args, aggregation)
+
+        disaggregate_network(network, reduced, clustering)
+
+        export_network(network, path, args)
+
+    else:
+        lopf_iterations(network, args, Constraints(args))
+
+
+def aggregated_lopf(network, args, aggregation):
+    method = args["method"]
+
+    if method.get("type", "lopf") != "lopf" or not method["pyomo"]:
+        raise Exception("Aggregation der Snapshots nur mit pyomo=True möglich.")
+
+    x = time.time()
+
+    clustering = cluster_snapshots(
+        network,
+        solve_snapshots(network, args),
+        aggregation["n_clusters"],
+        aggregation.get("period_length", 24),
+        aggregation.get("method", "kmedoids"),
+    )
+    reduced = aggregate_network(network, clustering)
+
+    print("Time for aggregation [s]:", round(time.time() - x, 2))
+
+    lopf_iterations(
+        reduced, dict(args, load_window=True), Constraints(args, clustering)
+    )
+
+    return reduced, clustering
+
+
+# ausbaubare Komponenten und Kapazitätsattribute
+NOMINAL_ATTRS = [
+    ("Generator", "p_nom"),
+    ("Link", "p_nom"),
+    ("StorageUnit", "p_nom"),
+    ("Line", "s_nom"),
+    ("Transformer", "s_nom"),
+    ("Store", "e_nom"),
+]
+
+
+def expansion_cost(network, nominal):
+    # annualisierte Kosten des Ausbaus gegenüber den Kapazitäten in nominal
+    cost = 0.0
+
+    for c, attr in NOMINAL_ATTRS:
+        df = network.df(c)
+        ext = nominal[c].index
+        cost += (
+            df.loc[ext, "capital_cost"] * (df.loc[ext, attr + "_opt"] - nominal[c])
+        ).sum()
+
+    return cost
+
+
+def two_stage(network, args):
+    # 1. Stufe: Kapazitäten auf reduzierter Zeitauflösung (typische Zeiträume
+    # oder zusammengefasste Stunden), 2. Stufe: Einsatz in voller Auflösung
+    settings = args["two_stage"]
+    path = args["csv_export"]
+
+    nominal = {
+        c: network.df(c).loc[network.df(c)[attr + "_extendable"], attr].copy()
+        for c, attr in NOMINAL_ATTRS
+    }
+
+    x = time.time()
+
+    args_1 = dict(args, csv_export=path + "/stage_1/")
+
+    if "n_clusters" in settings:
+        reduced, clustering = aggregated_lopf(network, args_1, settings)
+    else:
+        reduced = downsample_network(
+            network, solve_snapshots(network, args), settings.get("resolution", 3)
+        )
+        lopf_iterations(reduced, dict(args_1, load_window=True), Constraints(args))
+
+    time_1 = time.time() - x
+
+    # Kapazitäten und angepasste Leitungsimpedanzen übernehmen
+    for c, attr in NOMINAL_ATTRS:
+        ext = nominal[c].index
+        network.df(c).loc[ext, attr] = reduced.df(c).loc[ext, attr + "_opt"]
+
+    ext = nominal["Line"].index
+    for attr in ["x", "r", "g", "b", "num_parallel"]:
+        network.lines.loc[ext, attr] = reduced.lines.loc[ext, attr]
+
+    fix_capacities(network)
+
+    x = time.time()
+
+    if args.get("decomposition"):
+        decomposed_dispatch(network, args, export=False)
+    else:
+        run_lopf(network, args, Constraints(args).extra_functionalities, export=False)
+
+    time_2 = time.time() - x
+
+    # Ausbauentscheidungen wiederherstellen, damit calc_results die
+    # Investkosten der 1. Stufe auswertet
+    for c, attr in NOMINAL_ATTRS:
+        ext = nominal[c].index
+        network.df(c).loc[ext, attr + "_opt"] = network.df(c).loc[ext, attr]
+        network.df(c).loc[ext, attr] = nominal[c]
+        network.df(c).loc[ext, attr + "_extendable"] = True
+
+    capex = expansion_cost(network, nominal)
+    dispatch = network.objective
+    network.objective = dispatch + capex
+
+    # Abweichung der Zielfunktion der 1. Stufe von den Kosten bei Einsatz in
+    # voller Auflösung
+    report = pd.Series(
+        {
+            "objective stage 1": reduced.objective,
+            "operation stage 1": reduced.objective - capex,
+            "investment": capex,
+            "operation stage 2": dispatch,
+            "objective stage 2": network.objective,
+            "gap": network.objective - reduced.objective,
+            "relative gap": relative_change(reduced.objective, network.objective),
+            "time stage 1 [s]": time_1,
+            "time stage 2 [s]": time_2,
+        }
+    )
+
+    os.makedirs(path, exist_ok=True)
+    report.to_csv(os.path.join(path, "two_stage.csv"), header=["value"])
+
+    print("Two-stage optimization:")
+    print(report)
+
+    export_network(network, path, args)
+
+    return report
+
+
+# Anlagenparameter, in args["plant"] überschreibbar
+PLANT = {
+    "c_v": 0.2,  # marginal loss for each additional generation of heat
+    "c_m": 0.75,  # backpressure limit
+    "ta_target": 2976,  # Zielwert der Trocknungsanlage über das Jahr
+}
+
+
+def plant_parameters(args):
+    return dict(PLANT, **(args.get("plant") or {}))
+
+
+def kwk_efficiencies(network, c_v=PLANT["c_v"]):
+    # Effizienzen der Wärme-Links der KWK-Anlagen an extra KWK-Constraints anpassen
+    # (bevor pyomo.model erstellt wird an dieser Stelle)
+    # KWK: elektrische und Wärme-Links
+    electric_bool = network.links.carrier == "KWK_AC"
+    heat_bool = network.links.carrier == "KWK_heat"
+    electric_links = network.links.index[electric_bool]
+    heat_links = network.links.index[heat_bool]
+    # Effizienzen Wärme-Links
+    network.links.loc[heat_links, "efficiency"] = (
+        network.links.loc[electric_links, "efficiency"] / c_v
+    ).values.mean()
+
+
+def lopf_iterations(network, args, constraints):
+    method = args["method"]
+    path = args["csv_export"]
+
+    ext = network.lines[network.lines.s_nom_extendable]
+
+    if not ext.empty:
+        # s_nom_pre = s_nom_opt of previous iteration
+        l_snom_pre = network.lines.s_nom.copy()
+
+        # Iteration bis zur Konvergenz, höchstens n_iter Iterationen
+        n_iter = method["n_iter"]
+        tolerance = method.get("tolerance", 1e-3)
+
+        # Modell über die Iterationen hinweg wiederverwenden (nur pyomo)
+        persistent = None
+        if (
+            method.get("persistent", False)
+            and method.get("type", "lopf") == "lopf"
+            and method["pyomo"]
+        ):
+            persistent = PersistentLopf(args, constraints.extra_functionalities)
+
+        history = []
+        s_nom_opt_pre = None
+        objective_pre = None
+        start = 1
+
+        # nach jeder Iteration Checkpoint im Exportordner, ein erneuter Lauf
+        # mit denselben args setzt nach der letzten abgeschlossenen Iteration fort
+        checkpoint = None
+        if args.get("checkpoint", False):
+            checkpoint = Checkpoint(network, args)
+            state = checkpoint.load(network, ext.index)
+
+            if state is not None:
+                resume_export()
+
+                history = state["history"]
+                l_snom_pre = state["s_nom_pre"]
+                s_nom_opt_pre = network.lines.loc[ext.index, "s_nom_opt"].copy()
+                objective_pre = network.objective
+                start = state["iteration"] + 1
+
+                if state["converged"]:
+                    print("s_nom iteration converged after", start - 1, "iterations")
+                    start = n_iter + 1
+
+        for i in range(start, (1 + n_iter)):
+            # adapt s_nom per iteration
+            if i > 1:
+                adapt_impedances(network, ext.index, l_snom_pre)
+
+                # Set snom_pre to s_nom_opt for next iteration
+                l_snom_pre = network.lines.s_nom_opt.copy()
+
+            run_lopf(
+                network,
+                args,
+                constraints.extra_functionalities,
+                persistent=persistent,
+                basis=checkpoint.basis if checkpoint is not None else None,
+            )
+
+            path_it = path + "/lopf_iteration_" + str(i)
+            export_network(network, path_it, args)
+
+            # relative Änderung von s_nom_opt und Zielfunktion zur Vorgängeriteration
+            s_nom_opt = network.lines.loc[ext.index, "s_nom_opt"].copy()
+
+            if s_nom_opt_pre is None:
+                s_nom_change = objective_change = np.nan
+            else:
+                s_nom_change = relative_change(s_nom_opt, s_nom_opt_pre)
+                objective_change = relative_change(network.objective, objective_pre)
+
+            history.append(
+                {
+                    "iteration": i,
+                    "objective": network.objective,
+                    "s_nom_change": s_nom_change,
+                    "objective_change": objective_change,
+                }
+            )
+
+            converged = s_nom_change < tolerance and objective_change < tolerance
+
+            if checkpoint is not None:
+                with phase("checkpoint"):
+                    checkpoint.save(
+                        network, ext.index, i, l_snom_pre, history, converged
+                    )
+
+            if converged:
+                print("s_nom iteration converged after", i, "iterations")
+                break
+
+            s_nom_opt_pre = s_nom_opt
+            objective_pre = network.objective
+
+        history = pd.DataFrame(history).set_index("iteration")
+        # mit "export": "hdf5" legt erst der Hintergrund-Export den Ordner an
+        os.makedirs(path, exist_ok=True)
+        history.to_csv(path + "/convergence.csv")
+
+        print("Convergence of s_nom iteration:")
+        print(history)
+
+    else:
+        run_lopf(network, args, constraints.extra_functionalities)
+
+
+def relative_change(new, old):
+    new = np.asarray(new, dtype=float)
+    old = np.asarray(old, dtype=float)
+
+    if new.size == 0:
+        return 0.0
+
+    return np.max(np.abs(new - old) / np.maximum(np.abs(old), 1e-6))
+
+
+def adapt_impedances(network, lines, l_snom_pre):
+    # Impedanzen an die optimierte Leitungskapazität anpassen (parallele
+    # Leitungen), Leitungen ohne Kapazität bleiben unverändert
+    s_nom_opt = network.lines.loc[lines, "s_nom_opt"]
+    s_nom_pre = l_snom_pre[lines]
+    lines = lines[(s_nom_opt > 0) & (s_nom_pre > 0)]
+
+    ratio = l_snom_pre[lines] / network.lines.loc[lines, "s_nom_opt"]
+
+    # bei Leitungstypen werden x, r, g, b aus dem Typ berechnet, daher über
+    # die Anzahl paralleler Systeme anpassen
+    typed = network.lines.loc[lines, "type"] != ""
+    typed, untyped = lines[typed], lines[~typed]
+
+    network.lines.loc[typed, "num_parallel"] /= ratio[typed]
+
+    for attr in ["x", "r"]:
+        network.lines.loc[untyped, attr] *= ratio[untyped]
+    for attr in ["g", "b"]:
+        network.lines.loc[untyped, attr] /= ratio[untyped]
+
+
+def fix_capacities(network):
+    # reine Einsatzoptimierung: Kapazitäten auf p_nom, s_nom, e_nom festlegen,
+    # gibt die bisherigen Ausbau-Flags für release_capacities zurück
+    flags = {}
+
+    for c, attr in NOMINAL_ATTRS:
+        flags[c] = network.df(c)[attr + "_extendable"].copy()
+        network.df(c)[attr + "_extendable"] = False
+
+    return flags
+
+
+def release_capacities(network, flags):
+    for c, attr in NOMINAL_ATTRS:
+        network.df(c)[attr + "_extendable"] = flags[c]
+
+
+# Variablen mit marginal_cost in der Zielfunktion (wie in pypsa)
+OPERATION_ATTRS = [
+    ("Generator", "p"),
+    ("StorageUnit", "p_dispatch"),
+    ("Store", "p"),
+    ("Link", "p0"),
+]
+
+
+def operation_cost(network, snapshots):
+    # Betriebskosten der Zielfunktion in den gegebenen Snapshots
+    weightings = network.snapshot_weightings.objective.loc[snapshots]
+    cost = 0.0
+
+    for c, attr in OPERATION_ATTRS:
+        p = network.pnl(c)[attr]
+        if p.empty:
+            continue
+
+        marginal_cost = network.get_switchable_as_dense(c, "marginal_cost", snapshots)
+        p = p.loc[snapshots].reindex(columns=marginal_cost.columns, fill_value=0.0)
+
+        cost += (p * marginal_cost).mul(weightings, axis=0).values.sum()
+
+    return cost
+
+
+def rolling_horizon(network, args):
+    settings = args["rolling_horizon"]
+    window = settings.get("window", 168)
+    overlap = settings.get("overlap", 24)
+
+    if not 0 <= overlap < window:
+        raise ValueError("Überlappung muss kleiner als das Zeitfenster sein.")
+
+    snapshots = solve_snapshots(network, args)
+    n_snapshots = len(snapshots)
+
+    flags = fix_capacities(network)
+
+    # Speicherstände werden von Fenster zu Fenster übergeben
+    cyclic = network.stores.e_cyclic.copy()
+    cyclic_su = network.storage_units.cyclic_state_of_charge.copy()
+    e_initial = network.stores.e_initial.copy()
+    soc_initial = network.storage_units.state_of_charge_initial.copy()
+    network.stores["e_cyclic"] = False
+    network.storage_units["cyclic_state_of_charge"] = False
+
+    x = time.time()
+
+    # Zielfunktionswert über alle Fenster, je Fenster nur die übernommenen
+    # Snapshots (nur Betriebskosten)
+    objective = 0.0
+
+    try:
+        start = 0
+        while True:
+            stop = min(start + window, n_snapshots)
+            commit = stop if stop == n_snapshots else stop - overlap
+
+            # Zielwert der Trocknungsanlage anteilig bis zum Ende des Fensters
+            target = plant_parameters(args)["ta_target"] * stop / n_snapshots
+
+            run_lopf(
+                network,
+                args,
+                Constraints(args, target=target).extra_functionalities,
+                snapshots=snapshots[start:stop],
+                export=False,
+            )
+
+            objective += operation_cost(network, snapshots[start:commit])
+
+            if stop == n_snapshots:
+                break
+
+            network.stores["e_initial"] = network.stores_t.e.loc[snapshots[commit - 1]]
+            network.storage_units["state_of_charge_initial"] = (
+                network.storage_units_t.state_of_charge.loc[snapshots[commit - 1]]
+            )
+
+            start = commit
+
+    finally:
+        # Eingangsdaten des Networks wiederherstellen
+        network.stores["e_cyclic"] = cyclic
+        network.storage_units["cyclic_state_of_charge"] = cyclic_su
+        network.stores["e_initial"] = e_initial
+        network.storage_units["state_of_charge_initial"] = soc_initial
+        release_capacities(network, flags)
+
+    network.objective = objective
+
+    print("Time for rolling horizon [min]:", round((time.time() - x) / 60, 2))
+
+    export_network(network, args["csv_export"], args)
+
+
+def split_cores(n_tasks, n_jobs=None, cores=None):
+    # Kerne auf gleichzeitige Läufe und Solver-Threads je Lauf aufteilen
+    cores = cores or os.cpu_count() or 1
+
+    if n_jobs is None:
+        n_jobs = cores
+
+    n_jobs = max(1, min(n_jobs, n_tasks, cores))
+
+    return n_jobs, max(1, cores // n_jobs)
+
+
+def thread_options(solver_name, solver_options, threads):
+    # Solver-Optionen mit den Threads je Lauf, cbc löst LPs ohne Threads,
+    # linopy und nomopyomo reichen die Option zudem fehlerhaft an die
+    # Kommandozeile weiter
+    solver_options = dict(solver_options)
+
+    if solver_name != "cbc":
+        solver_options["threads"] = threads
+
+    return solver_options
+
+
+def storage_levels(network):
+    # Speicherstände je Snapshot, Stores und StorageUnits zusammengefasst
+    return pd.concat(
+        [network.stores_t.e, network.storage_units_t.state_of_charge], axis=1
+    )
+
+
+def block_network(network, snapshots, initial, final, targets=()):
+    # Teilproblem eines Zeitblocks, Speicherstände am Anfang und Ende des
+    # Blocks aus der groben Lösung vorgegeben, targets: Stores, deren Endwert
+    # bereits eine Nebenbedingung festlegt (Zielwert der Trocknungsanlage)
+    block = network.copy(snapshots=snapshots)
+    stores = block.stores.index
+    units = block.storage_units.index
+    last = snapshots[-1]
+
+    block.stores["e_cyclic"] = False
+    block.stores["e_initial"] = initial[stores]
+    block.storage_units["cyclic_state_of_charge"] = False
+    block.storage_units["state_of_charge_initial"] = initial[units]
+
+    # Stores: e_min_pu und e_max_pu im letzten Snapshot auf den Endwert,
+    # zeitabhängige Grenzen bleiben in den übrigen Snapshots erhalten
+    e_nom = block.stores.e_nom
+    pinned = stores[(e_nom > 0) & ~stores.isin(targets)]
+
+    bounds = {
+        attr: block.get_switchable_as_dense("Store", attr, snapshots)
+        for attr in ["e_min_pu", "e_max_pu"]
+    }
+    level = (final[pinned] / e_nom[pinned]).clip(
+        bounds["e_min_pu"].loc[last, pinned], bounds["e_max_pu"].loc[last, pinned]
+    )
+
+    for attr, df in bounds.items():
+        df.loc[last, pinned] = level.values
+        block.stores_t[attr] = df
+
+    # StorageUnits: state_of_charge_set im letzten Snapshot, vorhandene
+    # Vorgaben bleiben erhalten
+    soc_set = block.storage_units_t.state_of_charge_set.reindex(
+        index=snapshots, columns=units
+    )
+    soc_set.loc[last] = final[units].values
+    block.storage_units_t.state_of_charge_set = soc_set
+
+    return block
+
+
+def solve_block(network, args, target):
+    run_lopf(
+        network,
+        args,
+        Constraints(args, target=target).extra_functionalities,
+        export=False,
+    )
+
+    outputs = {}
+    for c in network.iterate_components(
+        network.one_port_components | network.branch_components | {"Bus"}
+    ):
+        attrs = c.attrs[c.attrs.status.str.startswith("Output", na=False)]
+        outputs[c.name] = (
+            c.df[attrs.index[attrs.static].intersection(c.df.columns)],
+            {
+                attr: c.pnl[attr]
+                for attr in attrs.index[attrs.varying]
+                if not c.pnl[attr].empty
+            },
+        )
+
+    return network.objective, outputs
+
+
+def decomposed_dispatch(network, args, export=True):
+    # Einsatzoptimierung mit festen Kapazitäten in unabhängigen Zeitblöcken:
+    # Speicherstände an den Blockgrenzen aus einer groben Lösung, danach die
+    # Blöcke parallel in voller Auflösung
+    settings = args["decomposition"]
+    length = settings.get("block", 168)
+    resolution = settings.get("resolution", 24)
+
+    if length % resolution != 0:
+        raise ValueError("Blocklänge muss ein Vielfaches der groben Auflösung sein.")
+
+    snapshots = solve_snapshots(network, args)
+    n_snapshots = len(snapshots)
+
+    flags = fix_capacities(network)
+
+    try:
+        x = time.time()
+
+        # grobe Lösung über den gesamten Zeitraum
+        coarse = downsample_network(network, snapshots, resolution)
+        run_lopf(
+            coarse,
+            dict(args, load_window=True),
+            Constraints(args).extra_functionalities,
+            export=False,
+        )
+        levels = storage_levels(coarse)
+
+        print("Time for coarse dispatch [s]:", round(time.time() - x, 2))
+
+        cyclic = pd.concat(
+            [network.stores.e_cyclic, network.storage_units.cyclic_state_of_charge]
+        )
+        initial = pd.concat(
+            [network.stores.e_initial, network.storage_units.state_of_charge_initial]
+        )
+        # zyklische Speicher beginnen mit dem Endwert der groben Lösung
+        initial[cyclic] = levels.iloc[-1][cyclic[cyclic].index]
+
+        starts = list(range(0, n_snapshots, length))
+        blocks = []
+        for start in starts:
+            stop = min(start + length, n_snapshots)
+            final = levels.iloc[-(-stop // resolution) - 1]
+            blocks.append((snapshots[start:stop], initial, final))
+            initial = final
+
+        ta = plant_parameters(args)["ta_target"]
+        n_jobs, threads = split_cores(len(blocks), settings.get("n_jobs"))
+        solver_options = thread_options(
+            args["solver_name"], args["solver_options"], threads
+        )
+        block_args = dict(args, load_window=True, solver_options=solver_options)
+
+        x = time.time()
+
+        with ProcessPoolExecutor(
+            max_workers=n_jobs, mp_context=multiprocessing.get_context("spawn")
+        ) as executor:
+            futures = [
+                executor.submit(
+                    solve_block,
+                    block_network(network, sns, start_levels, final, ["TA"]),
+                    block_args,
+                    final.get("TA", ta),
+                )
+                for sns, start_levels, final in blocks
+            ]
+            results = [future.result() for future in futures]
+
+        print(
+            "Time for",
+            len(blocks),
+            "dispatch blocks with",
+            n_jobs,
+            "jobs [min]:",
+            round((time.time() - x) / 60, 2),
+        )
+
+        # Ergebnisse der Blöcke in network.*_t zusammensetzen
+        for name, (static, _) in results[0][1].items():
+            network.df(name).loc[static.index, static.columns] = static
+
+        for name in results[0][1]:
+            pnl = network.pnl(name)
+            for attr in results[0][1][name][1]:
+                pnl[attr] = pd.concat(
+                    [outputs[name][1][attr] for _, outputs in results]
+                ).reindex(network.snapshots, fill_value=0.0)
+
+        network.objective = sum(objective for objective, _ in results)
+
+    finally:
+        # Ausbau-Flags des Networks wiederherstellen
+        release_capacities(network, flags)
+
+    if export:
+        export_network(network, args["csv_export"], args)
+
+
+def solve_snapshots(network, args):
+    # Netzwerk wurde bereits nur über das Zeitfenster aufgebaut
+    if args.get("load_window", False):
+        return network.snapshots
+
+    start = args["start_snapshot"] - 1
+    end = args["end_snapshot"]
+
+    return network.snapshots[start:end]
+
+
+def profile_file(name):
+    if name.endswith(".json"):
+        return name
+
+    return os.path.join(PROFILE_DIR, name + ".json")
+
+
+def solver_profile(args):
+    # solver_name, solver_options und Backend aus dem Profil übernehmen
+    name = args.get("solver_profile")
+
+    if not name:
+        return args
+
+    fn = profile_file(name)
+    if not os.path.isfile(fn):
+        raise ValueError("Solver-Profil nicht gefunden: " + fn)
+
+    with open(fn) as f:
+        profile = json.load(f)
+
+    return dict(
+        args,
+        solver_profile=None,
+        solver_name=profile["solver_name"],
+        solver_options=profile["solver_options"],
+        method=dict(args["method"], **profile["method"]),
+    )
+
+
+def run_lopf(
+    network,
+    args,
+    extra_functionality,
+    snapshots=None,
+    export=True,
+    persistent=None,
+    basis=None,
+):
+    args = solver_profile(args)
+
+    x = time.time()
+
+    if snapshots is None:
+        snapshots = solve_snapshots(network, args)
+
+    with phase("lopf"):
+        solve_lopf(network, args, extra_functionality, snapshots, persistent, basis)
+
+    if math.isnan(network.objective):
+        raise Exception("LOPF nicht gelöst.")
+
+    y = time.time()
+    z = (y - x) / 60
+
+    print("Time for LOPF [min]:", round(z, 2))
+
+    if export:
+        export_network(network, args["csv_export"], args)
+
+
+def solve_lopf(
+    network, args, extra_functionality, snapshots, persistent=None, basis=None
+):
+    # Variablen, die durch ihre Grenzen auf 0 festgelegt sind, vor dem Lösen
+    # aus dem Modell entfernen
+    reduction = Reduction(args)
+    # Koeffizientenbereiche ausgeben und das Modell ggf. skalieren (linopy)
+    scaling = Scaling(args)
+
+    # extra_functionality wird nach dem Modellaufbau und vor dem Lösen aufgerufen,
+    # bei LP-Dateien enthält "solve" das Schreiben und Zurücklesen
+    def profiled_extra_functionality(network, snapshots):
+        end("model build")
+        with phase("extra_functionality"):
+            extra_functionality(network, snapshots)
+        reduction.reduce(network, snapshots)
+        scaling.scale(network, snapshots)
+        begin("solve")
+
+    # Übergabe des Modells an den Solver im Arbeitsspeicher statt über LP-Dateien
+    in_memory = args["method"].get("in_memory", False)
+
+    # basis: Datei der Solver-Basis für den Warmstart aus der vorherigen
+    # Iteration, die neue Basis wird dort abgelegt (nicht mit pyomo)
+    new_basis = basis + ".new" if basis is not None else None
+
+    if args["method"].get("type", "lopf") == "optimize":
+        # linopy-basierte Optimierung
+        component_index_names(network)
+
+        if in_memory and args["solver_name"] == "highs":
+            status, condition = optimize_highs(
+                network,
+                snapshots,
+                extra_functionality,
+                args["solver_options"],
+                reduction,
+                scaling,
+                basis,
+            )
+
+        else:
+            kwargs = {"io_api": "direct"} if in_memory else {}
+
+            if basis is not None:
+                kwargs.update(warmstart_fn=warmstart_file(basis), basis_fn=new_basis)
+
+            # wie network.optimize, die Lösung wird erst nach dem Rückgängigmachen
+            # von Reduktion und Skalierung übernommen
+            begin("model build")
+            model = create_linopy(network, snapshots)
+            profiled_extra_functionality(network, snapshots)
+            status, condition = model.solve(
+                solver_name=args["solver_name"],
+                **kwargs,
+                **args["solver_options"],
+            )
+            end("solve")
+
+            if status == "ok":
+                with phase("solution read-back"):
+                    assign_linopy(network, reduction, scaling)
+
+                keep_basis(new_basis, basis)
+
+        if status != "ok":
+            raise Exception("LOPF nicht gelöst: " + str(condition))
+
+        reduction.restore(network)
+
+    elif persistent is None:
+        if in_memory and not args["method"]["pyomo"]:
+            raise Exception(
+                "Übergabe im Arbeitsspeicher nur mit pyomo oder linopy möglich."
+            )
+
+        # solver_io nur mit pyomo verfügbar
+        kwargs = {"solver_io": "python"} if in_memory else {}
+
+        if basis is not None and not args["method"]["pyomo"]:
+            kwargs.update(warmstart=warmstart_file(basis) or False, store_basis=True)
+
+        begin("model build")
+        network.lopf(
+            snapshots=snapshots,
+            pyomo=args["method"]["pyomo"],
+            solver_name=args["solver_name"],
+            solver_options=args["solver_options"],
+            extra_functionality=profiled_extra_functionality,
+            **kwargs,
+        )
+        end("model build")
+        end("solve")
+
+        reduction.restore(network)
+
+        # nomopyomo legt die Basis im temporären Ordner des Solvers ab
+        if "store_basis" in kwargs and not math.isnan(network.objective):
+            keep_basis(getattr(network, "basis_fn", None), basis)
+
+    else:
+        persistent.lopf(network, snapshots)
+
+
+def create_linopy(network, snapshots):
+    # create_model führt auch consistency_check aus
+    return network.optimize.create_model(snapshots=snapshots)
+
+
+def assign_linopy(network, reduction=None, scaling=None):
+    # Skalierung rückgängig machen und entfernte Variablen (0) ergänzen, bevor
+    # Lösung und Dualwerte in das Network übernommen werden
+    if scaling is not None:
+        scaling.unscale(network)
+    if reduction is not None:
+        reduction.fill_solution(network)
+
+    network.optimize.assign_solution()
+    network.optimize.assign_duals()
+    network.optimize.post_processing()
+
+
+def optimize_highs(
+    network,
+    snapshots,
+    extra_functionality,
+    solver_options,
+    reduction=None,
+    scaling=None,
+    basis=None,
+):
+    # linopy-Modell direkt an HiGHS (highspy) übergeben, Lösung und Dualwerte
+    # als Arrays zurücklesen
+    with phase("model build"):
+        model = create_linopy(network, snapshots)
+
+    with phase("extra_functionality"):
+        extra_functionality(network, snapshots)
+
+    if reduction is not None:
+        reduction.reduce(network, snapshots)
+    if scaling is not None:
+        scaling.scale(network, snapshots)
+
+    with phase("model write"):
+        h = model.to_highspy()
+        for key, option in solver_options.items():
+            h.setOptionValue(key, option)
+
+        if warmstart_file(basis):
+            h.readBasis(basis)
+
+    with phase("solve"):
+        h.run()
+
+    condition = h.modelStatusToString(h.getModelStatus()).lower()
+    if condition != "optimal":
+        return "warning", condition
+
+    if basis is not None:
+        h.writeBasis(basis + ".new")
+        keep_basis(basis + ".new", basis)
+
+    begin("solution read-back")
+
+    solution = h.getSolution()
+    matrices = model.matrices
+
+    # Werte über die Labels der Variablen bzw. Nebenbedingungen zuordnen,
+    # fehlende Einträge (Label -1) bleiben NaN
+    primal = np.full(label_count(model.variables.labels) + 1, np.nan)
+    primal[matrices.vlabels] = solution.col_value
+    dual = np.full(label_count(model.constraints.labels) + 1, np.nan)
+    dual[matrices.clabels] = solution.row_dual
+
+    for name, labels in model.variables.labels.items():
+        model.solution[name] = xr.DataArray(primal[labels.values], labels.coords)
+
+    for name, labels in model.constraints.labels.items():
+        model.dual[name] = xr.DataArray(dual[labels.values], labels.coords)
+
+    model.objective_value = h.getObjectiveValue()
+    model.status = "ok"
+    model.termination_condition = condition
+
+    assign_linopy(network, reduction, scaling)
+
+    end("solution read-back")
+
+    return "ok", condition
+
+
+def component_index_names(network):
+    # der Export benennt die Indizes in "name" um, linopy benötigt
+    # die Komponentennamen als Dimensionen
+    for c in network.iterate_components():
+        c.df.index.name = c.name
+        for df in c.pnl.values():
+            df.columns.name = c.name
+
+
+class PersistentLopf:
+    # pyomo-Modell wird nur einmal aufgebaut, in den folgenden Iterationen
+    # werden nur die von den Leitungsimpedanzen abhängigen Kreis-Nebenbedingungen
+    # (Formulierung kirchhoff) ersetzt, bei Sensitivitäten nur Zielfunktion und
+    # Zielwert der Trocknungsanlage
+    def __init__(self, args, extra_functionality):
+        self.args = solver_profile(args)
+        self.extra_functionality = extra_functionality
+        self.reduction = Reduction(self.args)
+        self.scaling = Scaling(self.args)
+        self.snapshots = None
+
+    def prepare_solver(self, network):
+        solver_name = self.args["solver_name"]
+
+        # persistente Solver (z.B. gurobi_persistent) behalten das Modell und
+        # starten nach Änderungen von der letzten Basislösung (Warmstart)
+        if solver_name + "_persistent" in SolverFactory:
+            persistent = SolverFactory(solver_name + "_persistent")
+            if persistent.available(exception_flag=False):
+                solver_name += "_persistent"
+
+        network_lopf_prepare_solver(network, solver_name=solver_name)
+
+    def build(self, network, snapshots):
+        with phase("model build"):
+            network_lopf_build_model(network, snapshots, formulation="kirchhoff")
+
+        with phase("extra_functionality"):
+            self.extra_functionality(network, snapshots)
+
+        self.reduction.reduce(network, snapshots)
+        self.scaling.scale(network, snapshots)
+
+        with phase("model write"):
+            self.prepare_solver(network)
+
+        self.snapshots = snapshots
+
+    def update(self, network):
+        model = network.model
+        opt = network.opt
+        persistent = isinstance(opt, PersistentSolver)
+
+        # x_pu_eff bzw. r_pu_eff aus den angepassten Impedanzen
+        calculate_dependent_values(network)
+
+        if persistent:
+            for con in model.cycle_constraints.values():
+                opt.remove_constraint(con)
+
+        delete_components(model, "cycle_constraints")
+
+        define_passive_branch_flows_with_kirchhoff(
+            network, self.snapshots, skip_vars=True
+        )
+
+        if persistent:
+            for con in model.cycle_constraints.values():
+                opt.add_constraint(con)
+
+    def update_objective(self, network):
+        # Zielfunktion mit den aktuellen marginal_cost und capital_cost neu
+        # aufstellen, Nebenbedingungen bleiben unverändert
+        model = network.model
+
+        model.del_component(model.objective)
+        define_linear_objective(network, self.snapshots)
+
+        if isinstance(network.opt, PersistentSolver):
+            network.opt.set_objective(model.objective)
+
+    def update_target(self, network, target):
+        # rechte Seite der Nebenbedingung der Trocknungsanlage ersetzen
+        model = network.model
+        opt = network.opt
+        persistent = isinstance(opt, PersistentSolver)
+
+        if persistent:
+            for con in model.load_trocknungsanlage.values():
+                opt.remove_constraint(con)
+
+        delete_components(model, "load_trocknungsanlage")
+
+        trocknungsanlage_pyomo(network, self.snapshots, target)
+
+        if persistent:
+            for con in model.load_trocknungsanlage.values():
+                opt.add_constraint(con)
+
+    def lopf(self, network, snapshots):
+        if self.snapshots is None or not snapshots.equals(self.snapshots):
+            self.build(network, snapshots)
+        else:
+            with phase("model update"):
+                self.update(network)
+
+        self.solve(network)
+
+    def solve(self, network):
+        with phase("solve"):
+            network_lopf_solve(
+                network,
+                self.snapshots,
+                formulation="kirchhoff",
+                solver_options=self.args["solver_options"],
+                free_memory={},
+            )
+
+        self.reduction.restore(network)
+
+
+def delete_components(model, prefix):
+    # Nebenbedingungen inklusive der zugehörigen Indexmengen entfernen
+    for component in list(model.component_objects()):
+        if component.local_name.startswith(prefix):
+            model.del_component(component)
+
+
+def kwk_links(n):
+    # Zusammengehörigkeit der elektrischen und Wärme-Links aus der Link-Tabelle
+    if "kwk_pair" in n.links.columns:
+        pairs = n.links.kwk_pair.where(n.links.carrier == "KWK_AC", "")
+        pairs = pairs.fillna("")
+    else:
+        pairs = kwk_pairs(n.links)
+
+    pairs = pairs[pairs != ""]
+
+    return pairs.index, pd.Index(pairs.values)
+
+
+def kwk_constraints_nmp(n, sns, c_m=PLANT["c_m"]):
+    # Konstanten
+    nom_r = 1  # ratio between max heat output and max electric output
+    # c_m: backpressure limit
+    # Effizienzen der Wärme-Links bereits im Vorwege angepasst (bevor pyomo.model erstellt wird)
+
+    # KWK: elektrische und zugehörige Wärme-Links
+    electric_links, heat_links = kwk_links(n)
+
+    if electric_links.empty:
+        return
+
+    eff_el = n.links.loc[electric_links, "efficiency"].values
+    eff_ht = n.links.loc[heat_links, "efficiency"].values
+
+    # bei Ausbau der BHKWs
+    ext = (
+        n.links.loc[electric_links, "p_nom_extendable"].values
+        & n.links.loc[heat_links, "p_nom_extendable"].values
+    )
+
+    if ext.any():
+        link_pnom = get_var(n, "Link", "p_nom")
+
+        lhs = linexpr(
+            (eff_el[ext] * nom_r, link_pnom[electric_links[ext]]),
+            (-eff_ht[ext], link_pnom[heat_links[ext]].set_axis(electric_links[ext])),
+        )
+        define_constraints(n, lhs, "==", 0, "Link", "kwk_heat_power_output")
+
+    # Leistung an Links (Optimierungsvariable), Spalten der Wärme-Links nach den
+    # zugehörigen elektrischen Links benannt
+    link_p = get_var(n, "Link", "p").loc[sns]
+    p_el = link_p[electric_links]
+    p_ht = link_p[heat_links].set_axis(electric_links, axis=1)
+
+    # Verhältnis aus Strom- und Wärmeoutput
+    lhs = linexpr((c_m * eff_ht, p_ht), (-eff_el, p_el))
+    define_constraints(n, lhs, "<=", 0, "Link", "kwk_backpressure")
+
+    # Constraints zur Begrenzung des Biogaseinsatzes für Strom- und Wärmeoutput
+    # top_iso_fuel_line
+    lhs = linexpr((1, p_ht), (1, p_el))
+    rhs = pd.DataFrame(
+        np.broadcast_to(n.links.loc[electric_links, "p_nom"].values, lhs.shape),
+        index=lhs.index,
+        columns=lhs.columns,
+    )
+    define_constraints(n, lhs, "<=", rhs, "Link", "kwk_top_iso_fuel_line")
+
+
+def kwk_constraints_pyomo(n, sns, c_m=PLANT["c_m"]):
+    # Konstanten
+    nom_r = 1  # ratio between max heat output and max electric output
+    # c_m: backpressure limit
+    # Effizienzen der Wärme-Links bereits im Vorwege angepasst (bevor pyomo.model erstellt wird)
+
+    # KWK: elektrische und zugehörige Wärme-Links
+    electric_links, heat_links = kwk_links(n)
+
+    if electric_links.empty:
+        return
+
+    model = n.model
+    units = list(zip(electric_links, heat_links))
+    eff = n.links.efficiency
+    p_nom = n.links.p_nom
+
+    # bei Ausbau der BHKWs
+    ext = n.links.p_nom_extendable
+    ext_units = [(el, ht) for el, ht in units if ext[el] and ext[ht]]
+
+    if ext_units:
+        heat_power_output = {
+            el: LConstraint(
+                LExpression(
+                    [
+                        (eff[el] * nom_r, model.link_p_nom[el]),
+                        (-eff[ht], model.link_p_nom[ht]),
+                    ]
+                ),
+                "==",
+            )
+            for el, ht in ext_units
+        }
+        l_constraint(
+            model,
+            "kwk_heat_power_output",
+            heat_power_output,
+            [el for el, ht in ext_units],
+        )
+
+    # Verhältnis aus Strom- und Wärmeoutput
+    backpressure = {
+        (el, sn): LConstraint(
+            LExpression(
+                [
+                    (c_m * eff[ht], model.link_p[ht, sn]),
+                    (-eff[el], model.link_p[el, sn]),
+                ]
+            ),
+            "<=",
+        )
+        for el, ht in units
+        for sn in sns
+    }
+    l_constraint(model, "kwk_backpressure", backpressure, list(electric_links), sns)
+
+    # Constraints zur Begrenzung des Biogaseinsatzes für Strom- und Wärmeoutput
+    # top_iso_fuel_line
+    top_iso_fuel_line = {
+        (el, sn): LConstraint(
+            LExpression([(1, model.link_p[ht, sn]), (1, model.link_p[el, sn])]),
+            "<=",
+            LExpression(constant=p_nom[el]),
+        )
+        for el, ht in units
+        for sn in sns
+    }
+    l_constraint(
+        model, "kwk_top_iso_fuel_line", top_iso_fuel_line, list(electric_links), sns
+    )
+
+
+def kwk_constraints_linopy(n, sns, c_m=PLANT["c_m"]):
+    # Konstanten
+    nom_r = 1  # ratio between max heat output and max electric output
+    # c_m: backpressure limit
+    # Effizienzen der Wärme-Links bereits im Vorwege angepasst (bevor linopy.Model erstellt wird)
+
+    # KWK: elektrische und zugehörige Wärme-Links
+    electric_links, heat_links = kwk_links(n)
+
+    if electric_links.empty:
+        return
+
+    model = n.model
+    el = electric_links.rename("Link")
+
+    eff_el = xr.DataArray(n.links.loc[electric_links, "efficiency"].values, [el])
+    eff_ht = xr.DataArray(n.links.loc[heat_links, "efficiency"].values, [el])
+
+    # bei Ausbau der BHKWs
+    ext = (
+        n.links.loc[electric_links, "p_nom_extendable"].values
+        & n.links.loc[heat_links, "p_nom_extendable"].values
+    )
+
+    if ext.any():
+        el_ext = electric_links[ext].rename("Link-ext")
+        link_pnom = model.variables["Link-p_nom"]
+
+        lhs = model.linexpr(
+            (
+                xr.DataArray(eff_el.values[ext] * nom_r, [el_ext]),
+                link_pnom.sel({"Link-ext": el_ext}),
+            ),
+            (
+                xr.DataArray(-eff_ht.values[ext], [el_ext]),
+                link_pnom.sel({"Link-ext": heat_links[ext]}).assign_coords(
+                    {"Link-ext": el_ext}
+                ),
+            ),
+        )
+        model.add_constraints(lhs, "=", 0, name="Link-kwk_heat_power_output")
+
+    # Leistung an Links (Optimierungsvariable), Wärme-Links nach den
+    # zugehörigen elektrischen Links benannt
+    link_p = model.variables["Link-p"]
+    p_el = link_p.sel(Link=el)
+    p_ht = link_p.sel(Link=heat_links).assign_coords(Link=el)
+
+    # Verhältnis aus Strom- und Wärmeoutput
+    lhs = model.linexpr((c_m * eff_ht, p_ht), (-eff_el, p_el))
+    model.add_constraints(lhs, "<=", 0, name="Link-kwk_backpressure")
+
+    # Constraints zur Begrenzung des Biogaseinsatzes für Strom- und Wärmeoutput
+    # top_iso_fuel_line
+    lhs = model.linexpr((1, p_ht), (1, p_el))
+    rhs = xr.DataArray(n.links.loc[electric_links, "p_nom"].values, [el])
+    model.add_constraints(lhs, "<=", rhs, name="Link-kwk_top_iso_fuel_line")
+
+
+def trocknungsanlage_linopy(n, sns, target=PLANT["ta_target"]):
+    store_e = n.model.variables["Store-e"].sel(snapshot=sns[-1:], Store=["TA"])
+
+    n.model.add_constraints(
+        n.model.linexpr((1, store_e)), "=", target, name="Store-load_trocknungsanlage"
+    )
+
+
+def trocknungsanlage_nmp(n, sns, target=PLANT["ta_target"]):
+    store_e = get_var(n, "Store", "e").loc[sns[-1]]
+
+    lhs = linexpr(
+        (1, store_e["TA"]),
+        return_axes=True,
+    )
+
+    define_constraints(
+        n,
+        lhs,
+        "==",
+        target,
+        "Store_TA",
+        "load_trocknungsanlage",
+    )
+
+
+def trocknungsanlage_pyomo(n, sns, target=PLANT["ta_target"]):
+    def load_trocknungsanlage(model, snapshot):
+        lhs = n.model.store_e["TA", snapshot]
+        rhs = target
+
+        return lhs == rhs
+
+    setattr(
+        n.model,
+        "load_trocknungsanlage",
+        Constraint(sns[-1:], rule=load_trocknungsanlage),
+    )
+
+
+class Constraints:
+    def __init__(self, args, clustering=None, target=None):
+        self.args = args
+        self.clustering = clustering
+        self.plant = plant_parameters(args)
+        # Zielwert der Trocknungsanlage am Ende des Optimierungszeitraums
+        self.target = self.plant["ta_target"] if target is None else target
+
+    def extra_functionalities(self, network, snapshots):
+        args = self.args
+
+        if self.clustering is not None:
+            # typische Zeiträume: Speicher über inter-period Speicherstände koppeln
+            kwk_constraints_pyomo(network, snapshots, self.plant["c_m"])
+            for component in ["Store", "StorageUnit"]:
+                inter_period_linkage_pyomo(
+                    network, snapshots, self.clustering, component
+                )
+            trocknungsanlage_aggregated_pyomo(network, self.clustering, self.target)
+
+        elif args["method"].get("type", "lopf") == "optimize":
+            kwk_constraints_linopy(network, snapshots, self.plant["c_m"])
+            trocknungsanlage_linopy(network, snapshots, self.target)
+
+        elif args["method"]["pyomo"]:
+            kwk_constraints_pyomo(network, snapshots, self.plant["c_m"])
+            trocknungsanlage_pyomo(network, snapshots, self.target)
+
+        else:
+            kwk_constraints_nmp(network, snapshots, self.plant["c_m"])
+            trocknungsanlage_nmp(network, snapshots, self.target)
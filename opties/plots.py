@@ -25,6 +25,8 @@ import pandas as pd
 import matplotlib
 import matplotlib.pyplot as plt
 
+from profiling import profiled
+
 __copyright__ = (
     "Europa-Universität Flensburg, Centre for Sustainable Energy Systems, "
     "FossilExit Research Group"
@@ -41,6 +43,7 @@ matplotlib.rc("font", **font)
 # Netz
 
 
+@profiled
 def plot_network(network):
     network.plot(bus_sizes=0.00000001, line_widths=1, link_widths=1)
 
@@ -48,6 +51,7 @@ def plot_network(network):
 # Lasten
 
 
+@profiled
 def AC_load(network, snapshots=[0, 8759], hour="5H"):
     fig, ax = plt.subplots()
     ax.set_ylabel("elektrische Last in kW")
@@ -68,6 +72,7 @@ def AC_load(network, snapshots=[0, 8759], hour="5H"):
     fig.legend(loc="upper right")
 
 
+@profiled
 def AN_load(network, snapshots=[0, 8759], hour="5H"):
     fig, ax = plt.subplots()
     ax.set_ylabel("elektrische Last in kW")
@@ -89,6 +94,7 @@ def AN_load(network, snapshots=[0, 8759], hour="5H"):
     fig.legend(loc="upper right")
 
 
+@profiled
 def heat_load(network, snapshots=[0, 8759], hour="5H"):
     fig, ax = plt.subplots()
     ax.set_ylabel("Wärmelast in MW")
@@ -124,6 +130,7 @@ def heat_load(network, snapshots=[0, 8759], hour="5H"):
 # Netzeinspeiung und Netzbezug
 
 
+@profiled
 def grid_usage(network, snapshots=[0, 8759], hour="5H"):
     fig, ax = plt.subplots()
     ax.set_ylabel("Leistung in kW")
@@ -152,6 +159,7 @@ def grid_usage(network, snapshots=[0, 8759], hour="5H"):
 # elektrische Einspeisung in das IES
 
 
+@profiled
 def el_gen_ies(network, snapshots=[0, 8759], hour="5H"):
     fig, ax = plt.subplots()
 
@@ -193,6 +201,7 @@ def el_gen_ies(network, snapshots=[0, 8759], hour="5H"):
 # Nutzung der PV-Anlagen
 
 
+@profiled
 def pv_gen(network, snapshots=[0, 8759], hour="5H"):
     fig, ax = plt.subplots()
     ax.set_ylabel("elektrische Einspeisung in kW")
@@ -213,6 +222,7 @@ def pv_gen(network, snapshots=[0, 8759], hour="5H"):
     fig.legend(loc="upper right")
 
 
+@profiled
 def pv_gen_pot(network, snapshots=[0, 8759], hour="5H"):
     fig, ax = plt.subplots()
     ax.set_ylabel("pot. Einspeisung in kW")
@@ -262,6 +272,7 @@ def pv_gen_pot(network, snapshots=[0, 8759], hour="5H"):
 # Nutzung des Batteriespeichers
 
 
+@profiled
 def battery_usage(network, snapshots=[0, 8759], hour="5H"):
     fig, ax = plt.subplots()
     ax.set_ylabel("Ladezustand der Batterie in kWh")
@@ -280,6 +291,7 @@ def battery_usage(network, snapshots=[0, 8759], hour="5H"):
     fig.legend(loc="upper right")
 
 
+@profiled
 def battery_pv_usage(network, snapshots=[0, 8759], hour="5H"):
     fig, ax = plt.subplots()
     ax.set_ylabel("elektrische Einspeisung in kW")
@@ -313,6 +325,7 @@ def battery_pv_usage(network, snapshots=[0, 8759], hour="5H"):
 # Wärmeerzeugung
 
 
+@profiled
 def heat_gen(network, snapshots=[0, 8759], hour="5H"):
     fig, ax = plt.subplots()
     ax.set_ylabel("Wärmeerzeugung in MW")
@@ -353,6 +366,7 @@ def heat_gen(network, snapshots=[0, 8759], hour="5H"):
 # Nutzung des Wärmespeichers
 
 
+@profiled
 def heat_store_usage(network, snapshots=[0, 8759], hour="5H"):
     fig, ax = plt.subplots()
     ax.set_ylabel("Ladezustand des Wärmespeichers in MWh")
@@ -369,6 +383,7 @@ def heat_store_usage(network, snapshots=[0, 8759], hour="5H"):
     fig.legend(loc="upper right")
 
 
+@profiled
 def heat_gen_store_usage(network, snapshots=[0, 8759], hour="5H"):
     fig, ax = plt.subplots()
     ax.set_ylabel("Wärmeeinspeisung in MW")
@@ -416,6 +431,7 @@ def heat_gen_store_usage(network, snapshots=[0, 8759], hour="5H"):
 # KWKs und BGA
 
 
+@profiled
 def gas_gen_store(network, snapshots=[0, 8759], hour="5H"):
     fig, ax = plt.subplots()
     ax.set_ylabel("Gasverfügbarkeit")
@@ -453,6 +469,7 @@ def gas_gen_store(network, snapshots=[0, 8759], hour="5H"):
     fig.legend(loc="upper right")
 
 
+@profiled
 def gas_gen_usage(network, snapshots=[0, 8759], hour="5H"):
     fig, ax = plt.subplots()
     ax.set_ylabel("Gasnutzung in MW")
@@ -526,6 +543,7 @@ def gas_gen_usage(network, snapshots=[0, 8759], hour="5H"):
     ax.set_title("Biogasverfügbarkeit und -nutzung")
 
 
+@profiled
 def kwk_gas_usage(network, snapshots=[0, 8759], hour="5H"):
     fig, ax = plt.subplots()
     ax.set_ylabel("Gasnutzung in MW")
@@ -569,6 +587,7 @@ def kwk_gas_usage(network, snapshots=[0, 8759], hour="5H"):
     fig.legend(loc="upper right")
 
 
+@profiled
 def kwk_electrical_output(network, snapshots=[0, 8759], hour="5H"):
     fig, ax = plt.subplots()
     ax.set_ylabel("Stromerzeugung in kW")
@@ -602,6 +621,7 @@ def kwk_electrical_output(network, snapshots=[0, 8759], hour="5H"):
     fig.legend(loc="upper right")
 
 
+@profiled
 def kwk_heat_output(network, snapshots=[0, 8759], hour="5H"):
     fig, ax = plt.subplots()
     ax.set_ylabel("Wärmeerzeugung in kW")
@@ -635,6 +655,7 @@ def kwk_heat_output(network, snapshots=[0, 8759], hour="5H"):
     fig.legend(loc="upper right")
 
 
+@profiled
 def kwk_output(network, snapshots=[0, 8759], hour="5H"):
     fig, ax = plt.subplots()
     ax.set_ylabel("Strom- und Wärmeerzeugung in kW")
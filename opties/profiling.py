@@ -0,0 +1,276 @@
+# -*- coding: utf-8 -*-
+# Copyright 2023
+# Europa-Universität Flensburg,
+# Centre for Sustainable Energy Systems
+
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation; either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# File description
+"""
+This file contains the functions to record wall time, CPU time and peak
+memory of the individual phases of a run.
+"""
+
+import os
+import sys
+import time
+import json
+import pstats
+import cProfile
+import functools
+import tracemalloc
+
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+__copyright__ = (
+    "Europa-Universität Flensburg, Centre for Sustainable Energy Systems, "
+    "FossilExit Research Group"
+)
+__license__ = "GNU Affero General Public License Version 3 (AGPL-3.0)"
+__author__ = "KathiEsterl"
+
+
+# aktiver Profiler des laufenden Programms (None: keine Aufzeichnung)
+profiler = None
+
+
+def maxrss(who):
+    if resource is None:
+        return float("nan")
+
+    rss = resource.getrusage(who).ru_maxrss
+
+    # macOS in Byte, Linux in Kilobyte
+    return rss / 2**20 if sys.platform == "darwin" else rss / 1024
+
+
+def peak_rss():
+    # Linux: VmHWM seit dem letzten Zurücksetzen, sonst Maximum der Laufzeit
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+
+    return maxrss(resource.RUSAGE_SELF) if resource else float("nan")
+
+
+def reset_peak_rss():
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+class Profiler:
+    def __init__(self, cprofile=False, trace_memory=False):
+        self.phases = []
+        self.stack = []
+        self.start = time.perf_counter()
+        self.cprofile = cProfile.Profile() if cprofile else None
+        self.trace_memory = trace_memory
+
+        if self.trace_memory:
+            tracemalloc.start()
+        if self.cprofile is not None:
+            self.cprofile.enable()
+
+    def update_peaks(self):
+        # Spitzenwerte an die übergeordnete Phase weitergeben, bevor sie für
+        # eine neue Phase zurückgesetzt werden
+        if self.stack:
+            frame = self.stack[-1]
+            frame["peak rss [MB]"] = max(frame["peak rss [MB]"], peak_rss())
+            if self.trace_memory:
+                frame["peak traced [MB]"] = max(
+                    frame["peak traced [MB]"],
+                    tracemalloc.get_traced_memory()[1] / 2**20,
+                )
+
+    def begin(self, name):
+        self.update_peaks()
+        reset_peak_rss()
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+
+        self.stack.append(
+            {
+                "phase": name,
+                "depth": len(self.stack),
+                "start [s]": time.perf_counter() - self.start,
+                "wall": time.perf_counter(),
+                "cpu": time.process_time(),
+                "peak rss [MB]": 0.0,
+                "peak traced [MB]": 0.0,
+            }
+        )
+
+    def end(self, name):
+        # nur die zuletzt begonnene Phase mit diesem Namen beenden
+        if not self.stack or self.stack[-1]["phase"] != name:
+            return
+
+        self.update_peaks()
+        frame = self.stack.pop()
+
+        record = {
+            "phase": frame["phase"],
+            "depth": frame["depth"],
+            "start [s]": frame["start [s]"],
+            "wall [s]": time.perf_counter() - frame["wall"],
+            "cpu [s]": time.process_time() - frame["cpu"],
+            "peak rss [MB]": frame["peak rss [MB]"],
+        }
+        if self.trace_memory:
+            record["peak traced [MB]"] = frame["peak traced [MB]"]
+
+        self.phases.append(record)
+
+        if self.stack:
+            parent = self.stack[-1]
+            for key in ["peak rss [MB]", "peak traced [MB]"]:
+                parent[key] = max(parent[key], frame[key])
+
+    def summary(self):
+        summary = {
+            "phases": sorted(self.phases, key=lambda p: p["start [s]"]),
+            "total [s]": time.perf_counter() - self.start,
+            "peak rss [MB]": maxrss(resource.RUSAGE_SELF) if resource else None,
+            "peak rss solver [MB]": (
+                maxrss(resource.RUSAGE_CHILDREN) if resource else None
+            ),
+        }
+
+        if self.trace_memory:
+            snapshot = tracemalloc.take_snapshot()
+            summary["tracemalloc"] = [
+                {"location": str(stat.traceback), "size [MB]": stat.size / 2**20}
+                for stat in snapshot.statistics("lineno")[:20]
+            ]
+
+        return summary
+
+    def stop(self, fn):
+        while self.stack:
+            self.end(self.stack[-1]["phase"])
+
+        summary = self.summary()
+
+        if self.cprofile is not None:
+            self.cprofile.disable()
+            self.cprofile.dump_stats(os.path.splitext(fn)[0] + ".prof")
+
+            stats = pstats.Stats(self.cprofile).sort_stats("cumulative")
+            summary["cprofile"] = [
+                {
+                    "function": pstats.func_std_string(func),
+                    "ncalls": nc,
+                    "tottime [s]": tt,
+                    "cumtime [s]": ct,
+                }
+                for func, (cc, nc, tt, ct, callers) in sorted(
+                    stats.stats.items(), key=lambda item: -item[1][3]
+                )[:30]
+            ]
+
+        if self.trace_memory:
+            tracemalloc.stop()
+
+        os.makedirs(os.path.dirname(os.path.abspath(fn)), exist_ok=True)
+        with open(fn, "w") as f:
+            json.dump(summary, f, indent=2)
+
+        return summary
+
+
+def begin(name):
+    if profiler is not None:
+        profiler.begin(name)
+
+
+def end(name):
+    if profiler is not None:
+        profiler.end(name)
+
+
+@contextmanager
+def phase(name):
+    begin(name)
+    try:
+        yield
+    finally:
+        end(name)
+
+
+def profiled(func):
+    # Funktion als eigene Phase aufzeichnen, z.B. calc_results oder Plots
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with phase(func.__module__ + "." + func.__name__):
+            return func(*args, **kwargs)
+
+    return wrapper
+
+
+def start_profiling(args):
+    global profiler
+
+    settings = args.get("profiling")
+
+    if not settings:
+        profiler = None
+        return None
+
+    if not isinstance(settings, dict):
+        settings = {}
+
+    profiler = Profiler(
+        cprofile=settings.get("cprofile", False),
+        trace_memory=settings.get("tracemalloc", False),
+    )
+
+    return profiler
+
+
+def stop_profiling(args):
+    global profiler
+
+    if profiler is None:
+        return None
+
+    settings = args.get("profiling")
+    if not isinstance(settings, dict):
+        settings = {}
+
+    fn = settings.get(
+        "json",
+        os.path.join(
+            args["csv_export"], "profile_" + time.strftime("%Y%m%d_%H%M%S") + ".json"
+        ),
+    )
+
+    summary = profiler.stop(fn)
+    profiler = None
+
+    print("Profile written to:", fn)
+
+    return summary
@@ -0,0 +1,268 @@
+# -*- coding: utf-8 -*-
+# Copyright 2023
+# Europa-Universität Flensburg,
+# Centre for Sustainable Energy Systems
+
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation; either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# File description
+"""
+This file contains the functions to remove variables that are fixed to zero
+by their bounds (e.g. PV output at night, components without capacity) from
+the model before the solve and to map the solution back afterwards.
+"""
+
+import numpy as np
+import xarray as xr
+
+from profiling import phase
+
+__copyright__ = (
+    "Europa-Universität Flensburg, Centre for Sustainable Energy Systems, "
+    "FossilExit Research Group"
+)
+__license__ = "GNU Affero General Public License Version 3 (AGPL-3.0)"
+__author__ = "KathiEsterl"
+
+
+# Variablen und die Grenzen (bezogen auf p_nom), die beide 0 sein müssen
+BOUNDS = {
+    ("Generator", "p"): ["p_min_pu", "p_max_pu"],
+    ("Link", "p"): ["p_min_pu", "p_max_pu"],
+    ("StorageUnit", "p_dispatch"): ["p_max_pu"],
+    ("StorageUnit", "p_store"): ["p_min_pu"],
+}
+
+# Variablen und zugehörige Grenz-Nebenbedingungen im pyomo-Modell
+PYOMO = {
+    ("Generator", "p"): ("generator_p", ["generator_p_lower", "generator_p_upper"]),
+    ("Link", "p"): ("link_p", ["link_p_lower", "link_p_upper"]),
+    ("StorageUnit", "p_dispatch"): ("storage_p_dispatch", ["storage_p_upper"]),
+    ("StorageUnit", "p_store"): ("storage_p_store", ["storage_p_lower"]),
+}
+
+
+def zero_variables(network, snapshots):
+    # Snapshots x Komponenten, in denen die Variable auf 0 festgelegt ist
+    zero = {}
+
+    for (c, attr), bounds in BOUNDS.items():
+        df = network.df(c)
+
+        if df.empty:
+            continue
+
+        mask = network.get_switchable_as_dense(c, bounds[0], snapshots) == 0
+        for bound in bounds[1:]:
+            mask &= network.get_switchable_as_dense(c, bound, snapshots) == 0
+
+        # nicht ausbaubare Komponenten ohne Leistung
+        mask.loc[:, df.index[~df.p_nom_extendable & (df.p_nom == 0)]] = True
+
+        # Unit Commitment: Grenzen hängen vom Status ab
+        if "committable" in df.columns:
+            mask.loc[:, df.index[df.committable]] = False
+
+        if mask.values.any():
+            zero[(c, attr)] = mask
+
+    return zero
+
+
+class Reduction:
+    def __init__(self, args):
+        method = args["method"]
+
+        if not method.get("reduce", False):
+            self.backend = None
+        elif method.get("type", "lopf") == "optimize":
+            self.backend = "linopy"
+        elif method["pyomo"]:
+            self.backend = "pyomo"
+        else:
+            # nomopyomo schreibt das LP bereits beim Aufbau
+            self.backend = None
+
+        self.zero = {}
+
+    def reduce(self, network, snapshots):
+        # nach extra_functionality und vor dem Lösen aufrufen
+        self.zero = {}
+
+        if self.backend is None:
+            return
+
+        with phase("lp reduction"):
+            self.zero = zero_variables(network, snapshots)
+
+            if self.backend == "pyomo":
+                sizes = reduce_pyomo(network, self.zero)
+            else:
+                sizes = reduce_linopy(network, self.zero)
+
+        print("LP reduction: variables {} -> {}, constraints {} -> {}".format(*sizes))
+
+    def fill_solution(self, network):
+        # linopy: vor der Übernahme der Lösung in das Network aufrufen
+        if self.backend == "linopy" and self.zero:
+            with phase("lp reduction"):
+                fill_linopy(network, self.zero)
+
+    def restore(self, network):
+        # Dualwerte der entfernten Grenzen (0) nach der Übernahme der Lösung
+        if not self.zero:
+            return
+
+        with phase("lp reduction"):
+            for (c, attr), mask in self.zero.items():
+                pnl = network.pnl(c)
+                for mu in ["mu_lower", "mu_upper"]:
+                    if mu in pnl and not pnl[mu].empty:
+                        df = pnl[mu]
+                        cells = mask.reindex(
+                            index=df.index, columns=df.columns, fill_value=False
+                        )
+                        pnl[mu] = df.mask(cells & df.isna(), 0.0)
+
+
+def reduce_pyomo(network, zero):
+    model = network.model
+
+    n_vars = model.nvariables()
+    n_cons = model.nconstraints()
+    fixed = 0
+    deactivated = 0
+
+    for key, mask in zero.items():
+        var_name, con_names = PYOMO[key]
+        var = getattr(model, var_name)
+        cons = [getattr(model, name) for name in con_names if hasattr(model, name)]
+
+        cells = mask.stack()
+        for sn, name in cells.index[cells.values]:
+            if (name, sn) not in var or var[name, sn].fixed:
+                continue
+
+            # feste Variablen schreibt pyomo als Konstanten
+            var[name, sn].fix(0)
+            fixed += 1
+
+            for con in cons:
+                if (name, sn) in con and con[name, sn].active:
+                    con[name, sn].deactivate()
+                    deactivated += 1
+
+    return n_vars, n_vars - fixed, n_cons, n_cons - deactivated
+
+
+def count_labels(labels):
+    return int(sum((da != -1).sum() for da in labels.values()))
+
+
+def reduce_linopy(network, zero):
+    model = network.model
+    variables = model.variables.labels
+    constraints = model.constraints
+
+    constraints.sanitize_zeros()
+    constraints.sanitize_missings()
+
+    n_vars = count_labels(variables)
+    n_cons = count_labels(constraints.labels)
+
+    dropped = []
+
+    for (c, attr), mask in zero.items():
+        name = c + "-" + attr
+
+        if name not in variables:
+            continue
+
+        labels = variables[name]
+        mask = mask.reindex(
+            index=labels.indexes["snapshot"],
+            columns=labels.indexes[c],
+            fill_value=False,
+        )
+        mask = xr.DataArray(
+            mask.values,
+            coords=[labels.coords["snapshot"], labels.coords[c]],
+        ).transpose(*labels.dims)
+        mask = mask & (labels != -1)
+
+        # Label -1: Variable wird nicht geschrieben, Terme entfallen
+        dropped.append(labels.values[mask.values])
+        variables[name] = labels.where(~mask, -1)
+
+    if dropped:
+        dropped = np.concatenate(dropped)
+
+        constraints.vars = constraints.vars.where(~constraints.vars.isin(dropped), -1)
+        model.objective = model.objective.sel(_term=~model.objective.vars.isin(dropped))
+
+        # Nebenbedingungen ohne verbleibende Variablen entfernen, sofern
+        # 0 (Vorzeichen) rhs erfüllt ist
+        check_empty_rows(constraints)
+        constraints.sanitize_zeros()
+        constraints.sanitize_missings()
+
+    return (
+        n_vars,
+        count_labels(variables),
+        n_cons,
+        count_labels(constraints.labels),
+    )
+
+
+def check_empty_rows(constraints):
+    for name in constraints.labels:
+        labels = constraints.labels[name]
+        empty = (constraints.vars[name] == -1).all(name + "_term") & (labels != -1)
+
+        if not empty.any():
+            continue
+
+        rhs = constraints.rhs[name]
+        sign = constraints.sign[name]
+
+        violated = (
+            ((sign == "=") & (rhs != 0))
+            | ((sign == "<=") & (rhs < 0))
+            | ((sign == ">=") & (rhs > 0))
+        )
+        violated = violated & empty
+
+        if violated.any():
+            raise Exception(
+                "Nebenbedingung "
+                + name
+                + " enthält nach der Reduktion keine Variablen mehr und ist "
+                "nicht erfüllbar ("
+                + str(int(violated.sum()))
+                + " Einträge, 0 "
+                + str(sign.where(violated, drop=True).values.ravel()[0])
+                + " "
+                + str(rhs.where(violated, drop=True).values.ravel()[0])
+                + ")."
+            )
+
+
+def fill_linopy(network, zero):
+    # entfernte Variablen haben in der Lösung keinen Wert
+    model = network.model
+
+    for c, attr in zero:
+        name = c + "-" + attr
+        if name in model.solution:
+            model.solution[name] = model.solution[name].fillna(0.0)
@@ -23,6 +23,8 @@ This file contains the functions to examine the optimization results.
 
 import pandas as pd
 
+from profiling import profiled
+
 __copyright__ = (
     "Europa-Universität Flensburg, Centre for Sustainable Energy Systems, "
     "FossilExit Research Group"
@@ -139,6 +141,7 @@ def calc_network_expansion(network):
     return lines, dc_links
 
 
+@profiled
 def calc_results(network):
     results = pd.DataFrame(
         columns=["Einheit", "Wert"],
@@ -0,0 +1,308 @@
+# -*- coding: utf-8 -*-
+# Copyright 2023
+# Europa-Universität Flensburg,
+# Centre for Sustainable Energy Systems
+
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation; either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# File description
+"""
+This file contains the functions to run a sweep over several scenarios of
+the args dict and the plant parameters in parallel processes and to compute
+cost sensitivities on a model that is built only once.
+"""
+
+import os
+import copy
+import math
+import time
+import itertools
+import contextlib
+import multiprocessing
+import pandas as pd
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from data import build_network, apply_overrides
+from optimization import (
+    optimization,
+    kwk_efficiencies,
+    plant_parameters,
+    solve_snapshots,
+    solver_profile,
+    split_cores,
+    thread_options,
+    Constraints,
+    PersistentLopf,
+)
+from results import calc_results
+from profiling import phase, start_profiling, stop_profiling
+
+__copyright__ = (
+    "Europa-Universität Flensburg, Centre for Sustainable Energy Systems, "
+    "FossilExit Research Group"
+)
+__license__ = "GNU Affero General Public License Version 3 (AGPL-3.0)"
+__author__ = "KathiEsterl"
+
+
+def parameter_grid(grid):
+    # alle Kombinationen, z.B. {"plant.c_v": [0.15, 0.2], "use_real_data": [False, True]}
+    keys = list(grid)
+
+    return [dict(zip(keys, values)) for values in itertools.product(*grid.values())]
+
+
+def set_parameter(args, key, value):
+    # Punkte im Schlüssel adressieren verschachtelte dicts, z.B. "method.n_iter"
+    # oder "overrides.Generator.NeAn.marginal_cost"
+    *parents, last = key.split(".")
+
+    node = args
+    for k in parents:
+        if not isinstance(node.get(k), dict):
+            node[k] = {}
+        node = node[k]
+
+    node[last] = value
+
+
+def scenario_args(args, scenario, path, threads):
+    args = copy.deepcopy(args)
+
+    for key, value in scenario.items():
+        set_parameter(args, key, value)
+
+    # Profil vor dem Setzen der Threads übernehmen
+    args = solver_profile(args)
+
+    args["csv_export"] = path
+    args["solver_options"] = thread_options(
+        args["solver_name"], args["solver_options"], threads
+    )
+
+    # Log-Datei des Solvers je Szenario
+    if "logFile" in args["solver_options"]:
+        args["solver_options"]["logFile"] = os.path.join(
+            path, os.path.basename(args["solver_options"]["logFile"])
+        )
+
+    return args
+
+
+def run_scenario(args):
+    os.makedirs(args["csv_export"], exist_ok=True)
+
+    # Ausgaben der parallelen Läufe getrennt je Szenario ablegen
+    with open(os.path.join(args["csv_export"], "opties.log"), "w") as log:
+        with contextlib.redirect_stdout(log):
+            start_profiling(args)
+
+            network = build_network(args)
+
+            optimization(network, args)
+
+            results = calc_results(network)
+
+            stop_profiling(args)
+
+    results.to_csv(os.path.join(args["csv_export"], "results.csv"))
+
+    return results
+
+
+def run_sweep(args, scenarios, path="opties_sweep/", n_jobs=None, cores=None):
+    # scenarios: Parameterraster (dict mit Wertelisten) oder Liste von dicts
+    if isinstance(scenarios, dict):
+        scenarios = parameter_grid(scenarios)
+
+    n_jobs, threads = split_cores(len(scenarios), n_jobs, cores)
+
+    print(
+        "Sweep over",
+        len(scenarios),
+        "scenarios with",
+        n_jobs,
+        "parallel jobs and",
+        threads,
+        "solver threads each",
+    )
+
+    table = pd.DataFrame(scenarios)
+    table.index.name = "scenario"
+
+    os.makedirs(path, exist_ok=True)
+    table.to_csv(os.path.join(path, "scenarios.csv"))
+
+    x = time.time()
+
+    results = {}
+    errors = {}
+
+    with ProcessPoolExecutor(
+        max_workers=n_jobs, mp_context=multiprocessing.get_context("spawn")
+    ) as executor:
+        futures = {
+            executor.submit(
+                run_scenario,
+                scenario_args(
+                    args,
+                    scenario,
+                    os.path.join(path, "scenario_" + str(i)) + "/",
+                    threads,
+                ),
+            ): i
+            for i, scenario in enumerate(scenarios)
+        }
+
+        for future in as_completed(futures):
+            i = futures[future]
+
+            try:
+                results[i] = future.result()
+            except Exception as e:
+                errors[i] = repr(e)
+                print("Scenario", i, "failed:", errors[i])
+            else:
+                print("Scenario", i, "finished")
+
+    print("Time for sweep [min]:", round((time.time() - x) / 60, 2))
+
+    # Ergebnistabellen aller Szenarien, Zeilen nach den Parametern indiziert
+    frame = pd.DataFrame(
+        {i: pd.to_numeric(r.Wert, errors="coerce") for i, r in results.items()}
+    ).T
+    frame = frame.reindex(table.index)
+    frame = frame[[c for c in frame.columns if ":" not in str(c)]]
+
+    if errors:
+        frame["error"] = pd.Series(errors)
+
+    frame.index = pd.MultiIndex.from_frame(
+        table.astype(str).reset_index().astype({"scenario": int})
+    )
+
+    frame.to_csv(os.path.join(path, "results.csv"))
+
+    return frame
+
+
+def cost_parameters(network, points):
+    # Ausgangswerte aller in den Punkten geänderten Komponentenparameter
+    base = {}
+
+    for point in points:
+        for key in point:
+            if key == "plant.ta_target":
+                continue
+
+            parts = key.split(".")
+            if parts[0] != "overrides" or len(parts) != 4:
+                raise ValueError(
+                    key + ": ohne Neuaufbau des Modells sind nur "
+                    "overrides.<Komponente>.<Name>.<Attribut> und "
+                    "plant.ta_target änderbar."
+                )
+
+            component, name, attr = parts[1:]
+            if attr not in ["marginal_cost", "capital_cost"]:
+                raise ValueError(key + ": nur marginal_cost und capital_cost.")
+
+            base[(component, name, attr)] = network.df(component).at[name, attr]
+
+    return base
+
+
+def run_sensitivity(args, points, path="opties_sensitivity/"):
+    # Kosten und Zielwert der Trocknungsanlage variieren, das pyomo-Modell wird
+    # nur einmal aufgebaut und für die folgenden Punkte angepasst
+    args = solver_profile(args)
+    method = args["method"]
+
+    if method.get("type", "lopf") != "lopf" or not method["pyomo"]:
+        raise Exception("Sensitivitätsanalyse nur mit pyomo=True möglich.")
+
+    if isinstance(points, dict):
+        points = parameter_grid(points)
+
+    network = build_network(args)
+    kwk_efficiencies(network, plant_parameters(args)["c_v"])
+
+    base = cost_parameters(network, points)
+    snapshots = solve_snapshots(network, args)
+
+    constraints = Constraints(args)
+    persistent = PersistentLopf(args, constraints.extra_functionalities)
+
+    results = {}
+    objectives = {}
+    times = {}
+
+    x = time.time()
+
+    for i, point in enumerate(points):
+        y = time.time()
+
+        point_args = copy.deepcopy(args)
+        for key, value in point.items():
+            set_parameter(point_args, key, value)
+
+        for (component, name, attr), value in base.items():
+            network.df(component).at[name, attr] = value
+        apply_overrides(network, point_args.get("overrides"))
+
+        target = plant_parameters(point_args)["ta_target"]
+
+        if i == 0:
+            constraints.target = target
+            persistent.build(network, snapshots)
+        else:
+            with phase("model update"):
+                persistent.update_objective(network)
+                persistent.update_target(network, target)
+
+        persistent.solve(network)
+
+        if math.isnan(network.objective):
+            raise Exception("LOPF für Punkt " + str(i) + " nicht gelöst.")
+
+        results[i] = calc_results(network)
+        objectives[i] = network.objective
+        times[i] = time.time() - y
+
+        print("Time for sensitivity point", i, "[s]:", round(times[i], 2))
+
+    for (component, name, attr), value in base.items():
+        network.df(component).at[name, attr] = value
+
+    print("Time for sensitivity [min]:", round((time.time() - x) / 60, 2))
+
+    table = pd.DataFrame(points)
+    table.index.name = "point"
+
+    frame = pd.DataFrame(
+        {i: pd.to_numeric(r.Wert, errors="coerce") for i, r in results.items()}
+    ).T
+    frame = frame[[c for c in frame.columns if ":" not in str(c)]]
+    frame["objective"] = pd.Series(objectives)
+    frame["time [s]"] = pd.Series(times)
+
+    frame.index = pd.MultiIndex.from_frame(
+        table.astype(str).reset_index().astype({"point": int})
+    )
+
+    os.makedirs(path, exist_ok=True)
+    frame.to_csv(os.path.join(path, "sensitivity.csv"))
+
+    return frame
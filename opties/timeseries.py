@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+# Copyright 2023
+# Europa-Universität Flensburg,
+# Centre for Sustainable Energy Systems
+
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation; either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# File description
+"""
+This file contains the functions to build and read a memory-mapped store
+of the load, heat, gas and PV time series covering one or several years.
+"""
+
+import os
+import json
+import numpy as np
+import pandas as pd
+
+from cache import file_signature
+
+__copyright__ = (
+    "Europa-Universität Flensburg, Centre for Sustainable Energy Systems, "
+    "FossilExit Research Group"
+)
+__license__ = "GNU Affero General Public License Version 3 (AGPL-3.0)"
+__author__ = "KathiEsterl"
+
+
+# Zeitreihen und zugehörige csv-Dateien (mehrere Jahre werden in der
+# angegebenen Reihenfolge aneinandergehängt)
+TIMESERIES = {
+    "el_load_synth": ["el_load_synth.csv"],
+    "el_load_real": ["el_load_real.csv"],
+    "heat_load_synth": ["heat_load_synth.csv"],
+    "gas_load": ["gas_load.csv"],
+    "pv_timeseries": ["pv_timeseries.csv"],
+}
+
+
+def infer_index(time, default=None):
+    # Zeitindex aus der time-Spalte, alternativ der übergebene Standardindex
+    if pd.api.types.is_numeric_dtype(time):
+        index = None
+    else:
+        try:
+            index = pd.DatetimeIndex(pd.to_datetime(time)).rename(None)
+        except (ValueError, TypeError):
+            index = None
+
+    if index is None or not index.is_monotonic_increasing:
+        if default is None:
+            raise ValueError("Zeitindex kann nicht aus den Daten abgeleitet werden.")
+        index = default
+
+    return index
+
+
+def is_current(store, name, files):
+    meta_fn = os.path.join(store, name + ".json")
+
+    if not os.path.isfile(meta_fn):
+        return False
+
+    with open(meta_fn) as f:
+        meta = json.load(f)
+
+    return meta["sources"] == [file_signature(fn) for fn in files]
+
+
+def build_store(path="data/timeseries/", store=None, timeseries=TIMESERIES):
+    if store is None:
+        store = path + "store/"
+
+    os.makedirs(store, exist_ok=True)
+
+    for name, files in timeseries.items():
+        files = [path + fn for fn in files if os.path.isfile(path + fn)]
+
+        if not files or is_current(store, name, files):
+            continue
+
+        df = pd.concat([pd.read_csv(fn) for fn in files], ignore_index=True)
+
+        if "time" in df.columns:
+            index = infer_index(df.pop("time"), pd.DatetimeIndex([]))
+        else:
+            index = pd.DatetimeIndex([])
+
+        np.save(os.path.join(store, name + ".npy"), df.values.astype("float64"))
+        np.save(os.path.join(store, name + "-index.npy"), index.asi8)
+
+        meta = {
+            "columns": df.columns.tolist(),
+            "sources": [file_signature(fn) for fn in files],
+        }
+        with open(os.path.join(store, name + ".json"), "w") as f:
+            json.dump(meta, f)
+
+    return store
+
+
+def open_timeseries(store, name):
+    with open(os.path.join(store, name + ".json")) as f:
+        meta = json.load(f)
+
+    values = np.load(os.path.join(store, name + ".npy"), mmap_mode="r")
+    index = np.load(os.path.join(store, name + "-index.npy"), mmap_mode="r")
+
+    return values, index, meta["columns"]
+
+
+def locate(index, snapshots=None, length=None):
+    # snapshots: (start_snapshot, end_snapshot) als Positionen wie in args
+    # oder als Zeitpunkte (Anfang und Ende inklusive)
+    if snapshots is None:
+        return 0, length
+
+    start, end = snapshots
+
+    if isinstance(start, (int, np.integer)):
+        return start - 1, min(end, length)
+
+    start = np.searchsorted(index, pd.Timestamp(start).value, side="left")
+    stop = np.searchsorted(index, pd.Timestamp(end).value, side="right")
+
+    return start, stop
+
+
+def align_window(store, name, index, start, stop):
+    # Zeilen einer Zeitreihe zum Zeitindex index: über den eigenen Zeitindex,
+    # liegt dieser in einem anderen Zeitraum (synthetische Zeitreihen zu den
+    # Messdaten), über die Positionen start:stop mit gleichem Monat, Tag und
+    # Stunde
+    _, time, _ = open_timeseries(store, name)
+
+    if len(time) == 0 or len(index) == 0:
+        return start, stop
+
+    own = pd.DatetimeIndex(time)
+
+    if own[0] <= index[0] <= own[-1]:
+        start, stop = locate(time, (index[0], index[-1]))
+        aligned = own[start:stop].equals(index)
+    else:
+        window = own[start:stop]
+        aligned = (
+            len(window) == len(index)
+            and (window.strftime("%m-%d %H") == index.strftime("%m-%d %H")).all()
+        )
+
+    if not aligned:
+        raise ValueError(
+            "Zeitindex der Zeitreihe " + name + " passt nicht zum Zeitraum "
+            "der Stromlast."
+        )
+
+    return start, stop
+
+
+def read_window(store, name, start, stop, index):
+    values, _, columns = open_timeseries(store, name)
+
+    if stop > len(values):
+        raise ValueError(
+            "Zeitreihe " + name + " enthält nur " + str(len(values)) + " Werte."
+        )
+
+    # Sicht auf das memory-mapped Array, es wird nichts kopiert
+    return pd.DataFrame(values[start:stop], index=index, columns=columns, copy=False)
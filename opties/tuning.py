@@ -0,0 +1,284 @@
+# -*- coding: utf-8 -*-
+# Copyright 2023
+# Europa-Universität Flensburg,
+# Centre for Sustainable Energy Systems
+
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation; either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# File description
+"""
+This file contains the functions to compare solvers and solver options on a
+truncated horizon of the model and to save the fastest combination as a
+solver profile, which is loaded with args["solver_profile"].
+"""
+
+import os
+import json
+import time
+import itertools
+import numpy as np
+import pandas as pd
+
+from pyomo.environ import SolverFactory
+
+from data import build_network
+from optimization import (
+    kwk_efficiencies,
+    plant_parameters,
+    profile_file,
+    run_lopf,
+    Constraints,
+)
+
+__copyright__ = (
+    "Europa-Universität Flensburg, Centre for Sustainable Energy Systems, "
+    "FossilExit Research Group"
+)
+__license__ = "GNU Affero General Public License Version 3 (AGPL-3.0)"
+__author__ = "KathiEsterl"
+
+
+# je Solver Dimensionen des Rasters, jeweils alternative Optionen, alle
+# Kombinationen werden gelöst ({}: Standardwerte des Solvers)
+GRIDS = {
+    "gurobi": [
+        [
+            {"method": 1},
+            {"method": 2},
+            {"method": 2, "crossover": 0},
+            {"method": 2, "crossover": 0, "BarHomogeneous": 1},
+        ],
+        [{}, {"Presolve": 2}],
+    ],
+    "highs": [
+        [
+            {"solver": "simplex", "simplex_strategy": 1},
+            {"solver": "simplex", "simplex_strategy": 4},
+            {"solver": "ipm"},
+            {"solver": "ipm", "run_crossover": "off"},
+        ],
+        [{}, {"presolve": "off"}],
+    ],
+    "glpk": [
+        [{}, {"interior": ""}],
+        [{}, {"presol": ""}],
+    ],
+    "cbc": [
+        [{}, {"presolve": "off"}],
+        [{}, {"scaling": "geometric"}, {"scaling": "equilibrium"}],
+        [{}, {"dualPivot": "steepest"}],
+    ],
+}
+
+# Backend je Solver (Einstellungen in args["method"]), sonst wie in args
+METHODS = {
+    "highs": {"type": "optimize", "in_memory": True},
+    "glpk": {"type": "lopf", "pyomo": True},
+    "cbc": {"type": "lopf", "pyomo": True},
+}
+
+# Optionen, die auf die geforderte Toleranz gesetzt werden
+TOLERANCES = {
+    "gurobi": ["BarConvTol", "FeasibilityTol", "OptimalityTol"],
+    "highs": [
+        "primal_feasibility_tolerance",
+        "dual_feasibility_tolerance",
+        "ipm_optimality_tolerance",
+    ],
+    "glpk": [],
+    "cbc": ["primalTolerance", "dualTolerance"],
+}
+
+TIME_LIMITS = {
+    "gurobi": "TimeLimit",
+    "highs": "time_limit",
+    "glpk": "tmlim",
+    "cbc": "sec",
+}
+
+# im Profil gespeicherte Einstellungen aus args["method"]
+PROFILE_METHOD = ["type", "pyomo", "in_memory"]
+
+
+def solver_available(solver_name):
+    if solver_name == "highs":
+        # Übergabe über linopy direkt an highspy
+        try:
+            import highspy  # noqa: F401
+        except ImportError:
+            return False
+        return True
+
+    return SolverFactory(solver_name).available(exception_flag=False)
+
+
+def candidates(solvers, grids):
+    for solver_name in solvers:
+        for combination in itertools.product(*grids[solver_name]):
+            options = {}
+            for part in combination:
+                options.update(part)
+            yield solver_name, options
+
+
+def candidate_args(args, solver_name, options, tolerance, time_limit=None):
+    solver_options = {key: tolerance for key in TOLERANCES.get(solver_name, [])}
+    solver_options.update(options)
+
+    if time_limit is not None and solver_name in TIME_LIMITS:
+        solver_options[TIME_LIMITS[solver_name]] = float(time_limit)
+
+    return dict(
+        args,
+        solver_profile=None,
+        solver_name=solver_name,
+        solver_options=solver_options,
+        method=dict(args["method"], **METHODS.get(solver_name, {})),
+    )
+
+
+def save_profile(name, args, **tuning):
+    fn = profile_file(name)
+
+    profile = {
+        "solver_name": args["solver_name"],
+        "method": {
+            key: args["method"][key] for key in PROFILE_METHOD if key in args["method"]
+        },
+        "solver_options": args["solver_options"],
+        "tuning": tuning,
+    }
+
+    os.makedirs(os.path.dirname(os.path.abspath(fn)), exist_ok=True)
+    with open(fn, "w") as f:
+        json.dump(profile, f, indent=2)
+
+    return fn
+
+
+def tune_solvers(
+    args,
+    solvers=None,
+    grids=GRIDS,
+    hours=720,
+    tolerance=1e-5,
+    time_limit=600,
+    repeat=1,
+    profile="tuned",
+    path="opties_tuning/",
+):
+    # verkürzter Zeitraum ab start_snapshot, ein LOPF ohne Iteration der
+    # Leitungsimpedanzen je Kombination
+    n_hours = args["end_snapshot"] - args["start_snapshot"] + 1
+    hours = min(hours, n_hours)
+
+    # Zielwert der Trocknungsanlage anteilig wie bei rolling_horizon
+    target = plant_parameters(args)["ta_target"] * hours / n_hours
+
+    args = dict(
+        args,
+        end_snapshot=args["start_snapshot"] + hours - 1,
+        load_window=True,
+    )
+
+    available = []
+    for solver_name in solvers or list(grids):
+        if solver_available(solver_name):
+            available.append(solver_name)
+        else:
+            print("Solver", solver_name, "not available, skipped")
+
+    if not available:
+        raise Exception("Keiner der Solver ist verfügbar.")
+
+    network = build_network(args)
+    kwk_efficiencies(network, plant_parameters(args)["c_v"])
+
+    rows = []
+
+    x = time.time()
+
+    for i, (solver_name, options) in enumerate(candidates(available, grids)):
+        run_args = candidate_args(args, solver_name, options, tolerance, time_limit)
+        # Nebenbedingungen je nach Backend des Solvers
+        extra_functionality = Constraints(run_args, target=target).extra_functionalities
+
+        times = []
+        status = "ok"
+
+        for _ in range(repeat):
+            network.objective = np.nan
+            y = time.time()
+
+            try:
+                run_lopf(network, run_args, extra_functionality, export=False)
+            except Exception as e:
+                status = repr(e)
+                break
+
+            times.append(time.time() - y)
+
+        rows.append(
+            {
+                "solver": solver_name,
+                "options": json.dumps(options),
+                "status": status,
+                "time [s]": min(times) if status == "ok" else np.nan,
+                "objective": network.objective if status == "ok" else np.nan,
+            }
+        )
+
+        print(
+            "Candidate",
+            i,
+            solver_name,
+            options,
+            status,
+            round(rows[-1]["time [s]"], 2),
+        )
+
+    print("Time for solver tuning [min]:", round((time.time() - x) / 60, 2))
+
+    table = pd.DataFrame(rows)
+    table.index.name = "candidate"
+
+    # Abweichung vom Median der gelösten Kombinationen
+    solved = table.status == "ok"
+    reference = table.objective[solved].median()
+    table["gap"] = (table.objective - reference).abs() / abs(reference)
+    table["valid"] = solved & (table.gap <= tolerance)
+
+    table = table.sort_values(["valid", "time [s]"], ascending=[False, True])
+
+    os.makedirs(path, exist_ok=True)
+    table.to_csv(os.path.join(path, "tuning.csv"))
+
+    print("Solver tuning:")
+    print(table[["solver", "options", "time [s]", "gap", "valid"]].to_string())
+
+    if not table.valid.any():
+        raise Exception("Keine Kombination innerhalb der Toleranz gelöst.")
+
+    best = table.iloc[0]
+    fn = save_profile(
+        profile,
+        candidate_args(args, best.solver, json.loads(best.options), tolerance),
+        hours=hours,
+        tolerance=tolerance,
+        **{"time [s]": best["time [s]"]},
+    )
+
+    print("Best solver options saved as profile", profile, "in", fn)
+
+    return table